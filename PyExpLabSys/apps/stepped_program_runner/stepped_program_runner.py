@@ -31,6 +31,7 @@ from os import path
 from time import strftime, time
 import traceback
 import types
+from collections import deque
 from functools import partial
 try:
     import Queue
@@ -101,6 +102,9 @@ class SteppedProgramRunner(QWidget):  # pylint: disable=too-many-instance-attrib
         #self.status_widgets = {}
         #self.status_formatters = {}
         self.status_defs = {}
+        # The step strings and the active step currently shown in the step table
+        self.step_strings = []
+        self.active_step = None
         self._init_ui()
         self.process_update_timer = QTimer()
         self.process_update_timer.timeout.connect(self.process_updates)
@@ -143,22 +147,47 @@ class SteppedProgramRunner(QWidget):  # pylint: disable=too-many-instance-attrib
             self.setWindowTitle(title)
         self.show()
 
+    def _get_updates(self):
+        """Return all the pending updates from the main program
+
+        The message queue of the main program can be either a Queue or a deque
+        """
+        updates = []
+        message_queue = self.core.message_queue
+        if isinstance(message_queue, deque):
+            while True:
+                try:
+                    updates.append(message_queue.popleft())
+                except IndexError:
+                    break
+        else:
+            while True:
+                try:
+                    updates.append(message_queue.get_nowait())
+                except Queue.Empty:
+                    break
+        return updates
+
     def process_updates(self):
         """Process updates from the main program"""
-        while True:
-            try:
-                update_type, update_content = self.core.message_queue.get(True, 0.001)
-                self.last = time()
-                if update_type == 'steps':
-                    self.update_step_table(update_content)
-                elif update_type == 'status':
-                    self.update_status(update_content)
-                elif update_type == 'message':
-                    self.append_text(update_content, text_type='message')
-                elif update_type == 'error':
-                    self.append_text(update_content, text_type='error')
-            except Queue.Empty:
-                break
+        updates = self._get_updates()
+        # Status updates are merged and the status table only updated once
+        status = {}
+        for update_type, update_content in updates:
+            if update_type == 'steps':
+                self.update_step_table(update_content)
+            elif update_type == 'active_step':
+                self.update_active_step(update_content)
+            elif update_type == 'status':
+                status.update(update_content)
+            elif update_type == 'message':
+                self.append_text(update_content, text_type='message')
+            elif update_type == 'error':
+                self.append_text(update_content, text_type='error')
+        if status:
+            self.update_status(status)
+        if updates:
+            self.last = time()
         self.process_update_timer.start(100)
 
     def update_step_table(self, steps):
@@ -176,6 +205,24 @@ class SteppedProgramRunner(QWidget):  # pylint: disable=too-many-instance-attrib
                 widget.setText(step)
             else:
                 self.step_table.setCellWidget(row, 0, QLabel(step))
+        self.step_strings = [step for _, step in steps]
+        self.active_step = None
+        for row, (active, _) in enumerate(steps):
+            if active:
+                self.active_step = row
+
+    def update_active_step(self, active_step):
+        """Move the highlight in the step table to a new active step"""
+        for row in (self.active_step, active_step):
+            if row is None or row >= len(self.step_strings):
+                continue
+            step = self.step_strings[row]
+            if row == active_step:
+                step = '<b>' + step + '</b>'
+            widget = self.step_table.cellWidget(row, 0)
+            if widget:
+                widget.setText(step)
+        self.active_step = active_step
 
     def update_status(self, status):
         """Update the status table"""
@@ -194,6 +194,35 @@ class DataSetSaver(object):
         query_args.extend(point)
         self.sql_saver.enqueue_query(self.insert_point_query, query_args)
 
+    def save_points(self, points):
+        """Save points for several codenames in a single query
+
+        Args:
+            points (dict or sequence): Mapping of codenames to points on the form
+                {codename1: (x1, y1), codename2: (x2, y2)} or a sequence of
+                (codename, point) pairs, which may hold several points per codename
+        """
+        DSS_LOG.debug('Save points: %s', points)
+        if isinstance(points, dict):
+            points = points.items()
+
+        query_args = []
+        number_of_points = 0
+        for codename, point in points:
+            try:
+                query_args.append(self.measurement_ids[codename])
+            except KeyError:
+                message = 'No entry in measurements_ids for codename: \'{}\''
+                raise ValueError(message.format(codename))
+            query_args.extend(point)
+            number_of_points += 1
+
+        if number_of_points == 0:
+            return
+        value_marker_string = ', '.join(['(%s, %s, %s)'] * number_of_points)
+        query = self.insert_batch_query.format(value_marker_string)
+        self.sql_saver.enqueue_query(query, query_args)
+
     def save_points_batch(self, codename, x_values, y_values, batchsize=1000):
         """Save a number points for the same codename in batches
 
@@ -49,6 +49,11 @@ except ImportError:
     import socketserver as SocketServer
 import time
 import json
+import collections
+try:
+    import orjson
+except ImportError:
+    orjson = None  # pylint: disable=invalid-name
 try:
     import Queue
 except ImportError:
@@ -86,6 +91,59 @@ def bool_translate(string):
     return True if str(string) == 'True' else False
 
 
+def _json_bytes(obj):
+    """Returns obj encoded as a compact json string in ASCII bytes
+
+    Uses :py:mod:`orjson` if it is installed and falls back to :py:mod:`json`
+    for objects orjson cannot serialize. json is also used if the orjson
+    output contains null, because orjson encodes NaN and infinity as null
+    where json gives NaN and Infinity, or if it is not ASCII, because orjson
+    does not escape non-ASCII characters. json is called with the same
+    separators as orjson, so the format does not depend on the encoder.
+    """
+    if orjson is not None:
+        try:
+            out = orjson.dumps(obj)
+        except TypeError:
+            pass
+        else:
+            if b'null' not in out and out.isascii():
+                return out
+    return json.dumps(obj, separators=(',', ':')).encode('ascii')
+
+
+def _date_point_time(entry, codename):
+    """Returns the time of the point for codename in a date data pull socket,
+    which is the x value
+    """
+    return entry['data'][codename][0]
+
+
+def _data_point_time(entry, codename):
+    """Returns the time of the point for codename in a data pull socket, which
+    is the time it was set
+    """
+    return entry['timestamps'][codename]
+
+
+def _date_stale_flags(entry, now):
+    """Returns whether the points in a date data pull socket are too old, in
+    codenames order, judged by their x values
+    """
+    data = entry['data']
+    return [timeout is not None and now - data[codename][0] > timeout
+            for codename, timeout in zip(entry['codenames'], entry['_timeouts'])]
+
+
+def _data_stale_flags(entry, now):
+    """Returns whether the points in a data pull socket are too old, in
+    codenames order, judged by the time they were set
+    """
+    timestamps = entry['timestamps']
+    return [timeout is not None and now - timestamps[codename] > timeout
+            for codename, timeout in zip(entry['codenames'], entry['_timeouts'])]
+
+
 def socket_server_status():
     """Returns the status of all socket servers
 
@@ -161,149 +219,262 @@ class PullUDPHandler(SocketServer.BaseRequestHandler):
         sock = self.request[1]
         PULLUHLOG.debug('Request \'%s\' received from %s on port %s',
                         command, self.client_address, self.port)
+        # Look up the data for this socket server once per request
+        entry = DATA[self.port]
+        # Get the time once per request, for the timeout checks
+        now = time.time()
 
         if command.count('#') == 1:
-            data = self._single_value(command)
+            data = self._single_value(command, entry, now)
         else:
             # The "name" and "status" commands are also handled here
-            data = self._all_values(command)
+            data = self._all_values(command, entry, now)
 
-        sock.sendto(data.encode('ascii'), self.client_address)
+        sock.sendto(data, self.client_address)
         PULLUHLOG.debug('Sent back \'%s\' to %s', data, self.client_address)
 
-    def _single_value(self, command):
-        """Returns a string for a single point
+    def _single_value(self, command, entry, now):
+        """Returns the encoded string for a single point
 
         Args:
             command (str): Complete command
+            entry (dict): The :data:`.DATA` entry for this socket server
+            now (float): The time of the request as returned by
+                :func:`time.time`
 
         Returns:
-            str: The data as a string (or an error) to be sent back
+            bytes: The data as an encoded string (or an error) to be sent back
         """
         PULLUHLOG.debug('Parsing single value command: %s', command)
         name, command = command.split('#')
+        data = entry['data']
+        if name in data:
+            timeout = entry['_timeouts'][entry['_codename_index'][name]]
         # Return as raw string
-        if command == 'raw' and name in DATA[self.port]['data']:
-            if self._old_data(name):
-                out = OLD_DATA
+        if command == 'raw' and name in data:
+            if self._old_data(name, timeout, entry, now):
+                out = OLD_DATA_BYTES
             else:
-                out = '{},{}'.format(*DATA[self.port]['data'][name])
+                point = data[name]
+                out = ('%s,%s' % (point[0], point[1])).encode('ascii')
 
-        elif command == 'json' and name in DATA[self.port]['data']:
-            if self._old_data(name):
-                out = six.text_type(json.dumps(OLD_DATA))
+        elif command == 'json' and name in data:
+            if self._old_data(name, timeout, entry, now):
+                out = _json_bytes(OLD_DATA)
             else:
-                out = six.text_type(json.dumps(DATA[self.port]['data'][name]))
+                out = _json_bytes(data[name])
         # The command is unknown
         else:
-            out = UNKNOWN_COMMAND
+            out = UNKNOWN_COMMAND_BYTES
 
         return out
 
     # pylint: disable=too-many-branches
-    def _all_values(self, command):
-        """Returns a string for all points or names
+    def _all_values(self, command, entry, now):
+        """Returns the encoded string for all points or names
 
         Args:
             command (str): Complete command
+            entry (dict): The :data:`.DATA` entry for this socket server
+            now (float): The time of the request as returned by
+                :func:`time.time`
 
         Returns:
-            str: The data as a string (or an error) to be sent back
+            bytes: The data as an encoded string (or an error) to be sent back
         """
         PULLUHLOG.debug('Parsing all-values command: %s', command)
+        data = entry['data']
+        codenames = entry['codenames']
         # Return a raw string with all measurements in codenames order
         if command == 'raw':
-            strings = []
-            for codename in DATA[self.port]['codenames']:
-                if self._old_data(codename):
-                    string = OLD_DATA
-                else:
-                    string = '{},{}'.format(*DATA[self.port]['data'][codename])
-                strings.append(string)
-            out = ';'.join(strings)
+            stale = self._stale_flags(entry, now)
+            out = ';'.join([OLD_DATA if old else '%s,%s' % (data[codename][0],
+                                                           data[codename][1])
+                            for codename, old in zip(codenames, stale)]).encode('ascii')
         # Return a json encoded string with list of all measurements
         elif command == 'json':
-            points = []
-            for codename in DATA[self.port]['codenames']:
-                if self._old_data(codename):
-                    data = OLD_DATA
-                else:
-                    data = DATA[self.port]['data'][codename]
-                points.append(data)
-            out = six.text_type(json.dumps(points))
+            stale = self._stale_flags(entry, now)
+            points = [OLD_DATA if old else data[codename]
+                      for codename, old in zip(codenames, stale)]
+            out = _json_bytes(points)
         # Return a raw string with all measurements in codenames order including names
         elif command == 'raw_wn':
-            strings = []
-            for codename in DATA[self.port]['codenames']:
-                if self._old_data(codename):
-                    string = '{}:{}'.format(codename, OLD_DATA)
-                else:
-                    string = '{}:{},{}'.format(
-                        codename, *DATA[self.port]['data'][codename]
-                        )
-                strings.append(string)
-            out = ';'.join(strings)
-        # Return a copy of the data dict encoded as a json string
+            stale = self._stale_flags(entry, now)
+            out = ';'.join([old_string if old else template % (data[codename][0],
+                                                               data[codename][1])
+                            for codename, old, (template, old_string) in zip(
+                                codenames, stale, entry['_raw_wn_templates'])]).encode('ascii')
+        # Return the data dict, with old data replaced, encoded as a json string
         elif command == 'json_wn':
-            datacopy = dict(DATA[self.port]['data'])
-            for codename in DATA[self.port]['codenames']:
-                if self._old_data(codename):
-                    datacopy[codename] = OLD_DATA
-            out = six.text_type(json.dumps(datacopy))
+            stale = self._stale_flags(entry, now)
+            out = _json_bytes({codename: OLD_DATA if old else data[codename]
+                               for codename, old in zip(codenames, stale)})
         # Return all codesnames in a raw string
         elif command == 'codenames_raw':
-            out = ','.join(DATA[self.port]['codenames'])
+            out = entry['_codenames_raw_bytes']
         # Return a list with all codenames encoded as a json string
         elif command == 'codenames_json':
-            out = six.text_type(json.dumps(DATA[self.port]['codenames']))
+            out = entry['_codenames_json_bytes']
         # Return the socket server name
         elif command == 'name':
-            out = DATA[self.port]['name']
+            out = entry['name'].encode('ascii')
         # Return status of system and all socket servers
         elif command == 'status':
-            out = six.text_type(json.dumps({
+            out = json.dumps({
                 'system_status': SYSTEM_STATUS.complete_status(),
                 'socket_server_status': socket_server_status()
-            }))
+            }).encode('ascii')
         # The command is not known
         else:
-            out = UNKNOWN_COMMAND
+            out = UNKNOWN_COMMAND_BYTES
 
         return out
 
-    def _old_data(self, codename):
+    @classmethod
+    def _stale_flags(cls, entry, now):
+        """Checks if the data has timed out for all the codenames in one pass
+
+        Args:
+            entry (dict): The :data:`.DATA` entry for this socket server
+            now (float): The time of the request as returned by
+                :func:`time.time`
+
+        Returns:
+            list: Whether the data is too old (bool) in codenames order
+        """
+        # Most sockets have no timeouts at all, in which case nothing is stale
+        if not entry['_has_timeouts']:
+            return [False] * len(entry['_timeouts'])
+        return cls._type_function(entry, '_stale_flags')(entry, now)
+
+    @classmethod
+    def _old_data(cls, codename, timeout, entry, now):
         """Checks if the data for codename has timed out
 
         Args:
             codename (str): The codename whose data should be checked for
                 timeout
+            timeout (float): The timeout for codename, or None for no timeout
+            entry (dict): The :data:`.DATA` entry for this socket server
+            now (float): The time of the request as returned by
+                :func:`time.time`
 
         Returns:
             bool: Whether the data is too old or not
         """
         PULLUHLOG.debug('Check if data for \'%s\' is too old', codename)
-        now = time.time()
-        if DATA[self.port]['type'] == 'date':
-            timeout = DATA[self.port]['timeouts'].get(codename)
-            if timeout is None:
-                out = False
-            else:
-                point_time = DATA[self.port]['data'][codename][0]
-                out = now - point_time > timeout
-        elif DATA[self.port]['type'] == 'data':
-            timeout = DATA[self.port]['timeouts'].get(codename)
-            if timeout is None:
-                out = False
-            else:
-                timestamp = DATA[self.port]['timestamps'][codename]
-                out = now - timestamp > timeout
-        else:
+        point_time = cls._type_function(entry, '_point_time')
+        return timeout is not None and now - point_time(entry, codename) > timeout
+
+    @staticmethod
+    def _type_function(entry, key):
+        """Returns the function for the timeout checks, which the socket
+        server chose for its type at init
+
+        Args:
+            entry (dict): The :data:`.DATA` entry for this socket server
+            key (str): The key of the function in the entry, ``'_stale_flags'``
+                or ``'_point_time'``
+
+        Returns:
+            function: The function stored under key
+
+        Raises:
+            NotImplementedError: If the socket server type has no such function
+        """
+        function = entry.get(key)
+        if function is None:
             message = 'Checking for timeout is not yet implemented for type '\
-                '\'{}\''.format(DATA[self.port]['type'])
+                '\'{}\''.format(entry.get('type'))
             PULLUHLOG.error(message)
             raise NotImplementedError(message)
+        return function
 
-        return out
+
+PULLUSLOG = logging.getLogger(__name__ + '.PullUDPServer')
+PULLUSLOG.addHandler(logging.NullHandler())
+class PullUDPServer(SocketServer.UDPServer):
+    """UDP server for the :class:`.DateDataPullSocket` and
+    :class:`.DataPullSocket` socket servers
+
+    The plain :py:class:`SocketServer.UDPServer` goes back to select after
+    every single datagram. When several clients poll at the same time, this
+    server instead handles all the datagrams that are already queued on the
+    socket (up to :attr:`max_batch`) every time select reports the socket as
+    readable. It also creates the request handler only once and reuses it for
+    all following datagrams, instead of instantiating a new one per datagram.
+    """
+
+    #: The maximum number of datagrams handled per wake up
+    max_batch = 64
+    #: Time in micro seconds to busy poll the network device for new datagrams
+    #: before sleeping (Linux only, 0 disables it). This lowers the latency at
+    #: the cost of CPU time. Values above the ``net.core.busy_read`` sysctl
+    #: require the CAP_NET_ADMIN capability.
+    busy_poll = 0
+
+    def __init__(self, server_address, RequestHandlerClass, bind_and_activate=True,
+                 busy_poll=None):
+        """Initialize the server
+
+        Args:
+            busy_poll (int): Time in micro seconds to busy poll for new datagrams,
+                see :attr:`busy_poll`. None (default) means use the class default
+        """
+        if busy_poll is not None:
+            self.busy_poll = busy_poll
+        SocketServer.UDPServer.__init__(self, server_address, RequestHandlerClass,
+                                        bind_and_activate=bind_and_activate)
+        self._handler = None
+
+    def server_bind(self):
+        """Enable busy polling, if requested, and bind the socket"""
+        if self.busy_poll:
+            if sys.platform.startswith('linux'):
+                try:
+                    self.socket.setsockopt(socket.SOL_SOCKET, SO_BUSY_POLL, self.busy_poll)
+                except socket.error as error:
+                    PULLUSLOG.warning('Unable to enable busy polling: %s', error)
+            else:
+                PULLUSLOG.warning('Busy polling is only supported on Linux')
+        SocketServer.UDPServer.server_bind(self)
+
+    def server_activate(self):
+        """Put the socket in non-blocking mode, so that the queue can be drained"""
+        self.socket.setblocking(False)
+
+    def _handle_request_noblock(self):
+        """Handle the queued datagrams, at most :attr:`max_batch` of them"""
+        for _ in range(self.max_batch):
+            try:
+                request, client_address = self.get_request()
+            except socket.error:
+                # Nothing more in the queue (EAGAIN)
+                break
+            if self.verify_request(request, client_address):
+                try:
+                    self.process_request(request, client_address)
+                except Exception:  # pylint: disable=broad-except
+                    self.handle_error(request, client_address)
+                    self.shutdown_request(request)
+            else:
+                self.shutdown_request(request)
+
+    def finish_request(self, request, client_address):
+        """Handle the request with the reused request handler"""
+        handler = self._handler
+        if handler is None:
+            # The handler handles the first request on instantiation
+            self._handler = self.RequestHandlerClass(request, client_address, self)
+            return
+        # Same steps as in BaseRequestHandler.__init__
+        handler.request = request
+        handler.client_address = client_address
+        handler.setup()
+        try:
+            handler.handle()
+        finally:
+            handler.finish()
 
 
 CDPULLSLOG = logging.getLogger(__name__ + '.CommonDataPullSocket')
@@ -322,7 +493,7 @@ class CommonDataPullSocket(threading.Thread):
     # pylint: disable=too-many-branches
     def __init__(self, name, codenames, port, default_x, default_y, timeouts,
                  check_activity, activity_timeout, init_timeouts=True,
-                 handler_class=PullUDPHandler):
+                 handler_class=PullUDPHandler, busy_poll=None):
         """Initializes internal variables and data structure in the
         :data:`.DATA` module variable
 
@@ -346,12 +517,15 @@ class CommonDataPullSocket(threading.Thread):
             init_timeouts (bool): Whether timeouts should be instantiated in
                 the :data:`.DATA` module variable
             handler_class (Sub-class of SocketServer.BaseRequestHandler): The
-                UDP handler to use in the server
+                UDP handler to use in the :class:`.PullUDPServer`
             check_activity (bool): Whether the socket server should monitor
                 activity. What detemines activity is described in the derived
                 socket servers.
             activity_timeout (float or int): The timespan in seconds which
                 constitutes in-activity
+            busy_poll (int): Time in micro seconds to busy poll for new
+                datagrams, see :attr:`.PullUDPServer.busy_poll`. None (default)
+                means use the class default
         """
         CDPULLSLOG.info('Initialize with: %s', call_spec_string())
         # Init thread
@@ -386,32 +560,52 @@ class CommonDataPullSocket(threading.Thread):
                 'check_activity': check_activity,
                 'activity_timeout': activity_timeout,
                 'last_activity': time.time()
-            }
+            },
+            '_raw_wn_templates': [],
+            # The timeouts in codenames order and the index of each codename,
+            # for the timeout checks in the request handler
+            '_timeouts': timeouts,
+            '_has_timeouts': any(timeout is not None for timeout in timeouts),
+            '_codename_index': {},
         }
         if init_timeouts:
             DATA[port]['timeouts'] = {}
+        # Count the codenames and collect the bad chars once, instead of for
+        # every codename
+        counts = collections.Counter(codenames)
+        bad_chars = set(BAD_CHARS)
         for name, timeout in zip(codenames, timeouts):
             # Check for duplicates
-            if codenames.count(name) > 1:
+            if counts[name] > 1:
                 message = 'Codenames must be unique; \'{}\' is present more '\
                     'than once'.format(name)
                 CDPULLSLOG.error(message)
                 raise ValueError(message)
             # Check for bad characters in the name
-            for char in BAD_CHARS:
-                if char in name:
-                    message = 'The character \'{}\' is not allowed in the '\
-                        'codenames'.format(char)
-                    CDPULLSLOG.error(message)
-                    raise ValueError(message)
+            if not bad_chars.isdisjoint(name):
+                char = next(char for char in BAD_CHARS if char in name)
+                message = 'The character \'{}\' is not allowed in the '\
+                    'codenames'.format(char)
+                CDPULLSLOG.error(message)
+                raise ValueError(message)
             # Init the point
             DATA[port]['data'][name] = (default_x, default_y)
+            DATA[port]['_codename_index'][name] = len(DATA[port]['_codename_index'])
             if init_timeouts:
                 DATA[port]['timeouts'][name] = timeout
+            # The codename part of the raw_wn output never changes, so it is
+            # formatted into the templates once here instead of per request
+            DATA[port]['_raw_wn_templates'].append(
+                (name.replace('%', '%%') + ':%s,%s', name + ':' + OLD_DATA)
+            )
+        # The codenames responses never change, so cache them ready to send
+        DATA[port]['_codenames_raw_bytes'] = ','.join(codenames).encode('ascii')
+        DATA[port]['_codenames_json_bytes'] = _json_bytes(list(codenames))
 
         # Setup server
         try:
-            self.server = SocketServer.UDPServer(('', port), handler_class)
+            self.server = PullUDPServer(('', port), handler_class,
+                                        busy_poll=busy_poll)
         except socket.error as error:
             if error.errno == 98:
                 # See custom exception message to understand this
@@ -461,12 +655,13 @@ class DataPullSocket(CommonDataPullSocket):
 
     def __init__(self, name, codenames, port=9010, default_x=0.0,
                  default_y=0.0, timeouts=None, check_activity=True,
-                 activity_timeout=900, poke_on_set=True):
+                 activity_timeout=900, poke_on_set=True, busy_poll=None):
         """Initializes internal variables and UPD server
 
         For parameter description of ``name``, ``codenames``, ``port``,
-        ``default_x``, ``default_y``, ``timeouts``, ``check_activity`` and
-        ``activity_timeout`` see :meth:`.CommonDataPullSocket.__init__`.
+        ``default_x``, ``default_y``, ``timeouts``, ``check_activity``,
+        ``activity_timeout`` and ``busy_poll`` see
+        :meth:`.CommonDataPullSocket.__init__`.
 
         Args:
             poke_on_set (bool): Whether to poke the socket server when a point
@@ -477,9 +672,12 @@ class DataPullSocket(CommonDataPullSocket):
         super(DataPullSocket, self).__init__(
             name, codenames, port=port, default_x=default_x,
             default_y=default_y, timeouts=timeouts,
-            check_activity=check_activity, activity_timeout=activity_timeout
+            check_activity=check_activity, activity_timeout=activity_timeout,
+            busy_poll=busy_poll
         )
         DATA[port]['type'] = 'data'
+        DATA[port]['_point_time'] = _data_point_time
+        DATA[port]['_stale_flags'] = _data_stale_flags
         # Init timestamps
         DATA[port]['timestamps'] = {}
         for name in codenames:
@@ -523,12 +721,13 @@ class DateDataPullSocket(CommonDataPullSocket):
 
     def __init__(self, name, codenames, port=9000, default_x=0.0,
                  default_y=0.0, timeouts=None, check_activity=True,
-                 activity_timeout=900, poke_on_set=True):
+                 activity_timeout=900, poke_on_set=True, busy_poll=None):
         """Init internal variavles and UPD server
 
         For parameter description of ``name``, ``codenames``, ``port``,
-        ``default_x``, ``default_y``, ``timeouts``, ``check_activity`` and
-        ``activity_timeout`` see :meth:`.CommonDataPullSocket.__init__`.
+        ``default_x``, ``default_y``, ``timeouts``, ``check_activity``,
+        ``activity_timeout`` and ``busy_poll`` see
+        :meth:`.CommonDataPullSocket.__init__`.
 
         Args:
             poke_on_set (bool): Whether to poke the socket server when a point
@@ -539,10 +738,13 @@ class DateDataPullSocket(CommonDataPullSocket):
         super(DateDataPullSocket, self).__init__(
             name, codenames, port=port, default_x=default_x,
             default_y=default_y, timeouts=timeouts,
-            check_activity=check_activity, activity_timeout=activity_timeout
+            check_activity=check_activity, activity_timeout=activity_timeout,
+            busy_poll=busy_poll
         )
         # Set the type
         DATA[port]['type'] = 'date'
+        DATA[port]['_point_time'] = _date_point_time
+        DATA[port]['_stale_flags'] = _date_stale_flags
         DDPULLSLOG.debug('Initialized')
         # Init poke_on_set
         self.poke_on_set = poke_on_set
@@ -1384,6 +1586,9 @@ BAD_CHARS = ['#', ',', ';', ':', '&']
 UNKNOWN_COMMAND = 'UNKNOWN_COMMMAND'
 #: The string used to indicate old or obsoleted data
 OLD_DATA = 'OLD_DATA'
+#: :data:`.UNKNOWN_COMMAND` and :data:`.OLD_DATA` encoded, ready to be sent
+UNKNOWN_COMMAND_BYTES = UNKNOWN_COMMAND.encode('ascii')
+OLD_DATA_BYTES = OLD_DATA.encode('ascii')
 #: The answer prefix used when a push failed
 PUSH_ERROR = 'ERROR'
 #: The answer prefix used when a push succeds
@@ -1393,6 +1598,9 @@ PUSH_ACK = 'ACK'
 PUSH_EXCEP = 'EXCEP'
 #: The answer prefix for a callback return value
 PUSH_RET = 'RET'
+#: The Linux socket option for busy polling, which the socket module does not
+#: expose
+SO_BUSY_POLL = getattr(socket, 'SO_BUSY_POLL', 46)
 #:The variable used to contain all the data.
 #:
 #:The format of the DATA variable is the following. The DATA variable is a
@@ -1412,7 +1620,15 @@ PUSH_RET = 'RET'
 #:   'data': {'var1': (0.0, 0.0)},
 #:   'name': 'my_socket',
 #:   'timeouts': {'var1': None},
-#:   'type': 'date'}
+#:   'type': 'date',
+#:   '_point_time': _date_point_time,
+#:   '_stale_flags': _date_stale_flags,
+#:   '_raw_wn_templates': [('var1:%s,%s', 'var1:OLD_DATA')],
+#:   '_codenames_raw_bytes': b'var1',
+#:   '_codenames_json_bytes': b'["var1"]',
+#:   '_timeouts': [None],
+#:   '_has_timeouts': False,
+#:   '_codename_index': {'var1': 0}}
 #:
 #:For a :class:`DataPullSocket` the dict will resemble this example:
 #:
@@ -1426,7 +1642,18 @@ PUSH_RET = 'RET'
 #:   'name': 'my_data_socket',
 #:   'timeouts': {'var1': None},
 #:   'timestamps': {'var1': 0.0},
-#:   'type': 'data'}
+#:   'type': 'data',
+#:   '_point_time': _data_point_time,
+#:   '_stale_flags': _data_stale_flags,
+#:   '_raw_wn_templates': [('var1:%s,%s', 'var1:OLD_DATA')],
+#:   '_codenames_raw_bytes': b'var1',
+#:   '_codenames_json_bytes': b'["var1"]',
+#:   '_timeouts': [None],
+#:   '_has_timeouts': False,
+#:   '_codename_index': {'var1': 0}}
+#:
+#:The keys that start with an underscore are pre-computed response parts used
+#:internally by the :class:`.PullUDPHandler`.
 #:
 #:For a :class:`DataPushSocket` the dict will resemble this example:
 #:
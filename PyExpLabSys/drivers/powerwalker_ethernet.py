@@ -14,31 +14,62 @@ class PowerWalkerEthernet(object):
             self.latest_event = datetime.datetime.min
         else:
             self.latest_event = datetime.datetime.now()
+        # The static data never changes, so it is only read once
+        self._static_data = None
+        self.ip_address = ip_address
         self.ssh = paramiko.SSHClient()
         self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        self.ssh.connect(ip_address, username='root',
+        self._connect()
+
+    def _connect(self):
+        """
+        Opens the SSH connection. All commands are run over this one
+        connection, which is kept alive between polls.
+        """
+        self.ssh.connect(self.ip_address, username='root',
                          password='12345678', look_for_keys=False)
+        self.ssh.get_transport().set_keepalive(30)
+
+    def _exec_command(self, command):
+        """
+        Executes command on the unit and returns stdout. The connection
+        is only re-opened if it has been lost.
+        """
+        transport = self.ssh.get_transport()
+        if transport is None or not transport.is_active():
+            self._connect()
+        stdin, stdout, stderr = self.ssh.exec_command(command, timeout=0.75)
+        return stdout
+
+    def _read_lines(self, command):
+        """
+        Executes command on the unit and returns the non-empty lines
+        of the output, stripped of whitespace. The output is read in one
+        go and the lines are returned as bytes, which int() accepts, so
+        only the text fields need to be decoded.
+        """
+        stdout = self._exec_command(command)
+        lines = [line.strip() for line in stdout.read().splitlines()]
+        return [line for line in lines if line]
 
     def _read_static_data(self):
         """
         Reads combined static information about the unit, this is
         traditionally returned as two seperate calls, thus this is
-        considered a private function.
+        considered a private function. The information is only read
+        from the unit on the first call.
         """
-        command = '/var/www/html/web_pages_Galleon/cgi-bin/baseInfo.cgi'
-        stdin, stdout, stderr = self.ssh.exec_command(command, timeout=0.75)
-        raw_lines = stdout.readlines()
+        if self._static_data is not None:
+            return self._static_data
 
-        lines = []
-        for line in raw_lines:
-            if line.strip():
-                lines.append(line.strip())
+        command = '/var/www/html/web_pages_Galleon/cgi-bin/baseInfo.cgi'
+        lines = self._read_lines(command)
 
         nominal_input = int(lines[4][0:3])
         nominal_output = int(lines[4][4:])
         values = {
-            'model': lines[2],
-            'version': lines[6],
+            'model': lines[2].decode('utf-8'),
+            'version': lines[6].decode('utf-8'),
             'nominal_input_voltage': nominal_input,
             'nominal_output_voltage': nominal_output,
             'nominal_output_frequency': int(lines[10]) / 10.0,
@@ -46,6 +77,7 @@ class PowerWalkerEthernet(object):
             'rated_va': int(lines[8]),
             'rated_output_current': int(lines[11]) / 10.0
         }
+        self._static_data = values
         return values
 
     def device_information(self):
@@ -69,16 +101,10 @@ class PowerWalkerEthernet(object):
 
     def device_status(self):
         command = '/var/www/html/web_pages_Galleon/cgi-bin/realInfo.cgi'
-        stdin, stdout, stderr = self.ssh.exec_command(command, timeout=0.75)
-        raw_lines = stdout.readlines()
-
-        lines = []
-        for line in raw_lines:
-            if line.strip():
-                lines.append(line.strip())
+        lines = self._read_lines(command)
 
         status = []   # TODO!
-        if not lines[1] == 'Line Mode':
+        if not lines[1] == b'Line Mode':
             status.append('Utility Fail')  # Compatibility with serial interface
 
         values = {
@@ -90,7 +116,7 @@ class PowerWalkerEthernet(object):
             'temperature': int(lines[2]) / 10.0,
             'status': status,
             'battery_capacity': int(lines[9]),
-            'remaining_battery': lines[10],  # minutes
+            'remaining_battery': lines[10].decode('utf-8'),  # minutes
             'output_frequency': int(lines[14]) / 10.0,
             'load_level': int(lines[17])
         }
@@ -100,8 +126,8 @@ class PowerWalkerEthernet(object):
 
     def read_events(self, only_new=False):
         command = 'cd /var/log/eventlog; cat "$(ls -1rt | tail -n1)"'
-        stdin, stdout, stderr = self.ssh.exec_command(command, timeout=0.75)
-        raw_lines = stdout.readlines()
+        stdout = self._exec_command(command)
+        raw_lines = stdout.read().decode('utf-8').splitlines()
 
         if len(raw_lines) < 2:
             print('PowerWalker Ethernet: Too few lines in event file')
@@ -1,30 +1,60 @@
+import re
 import sys
 import json
 import requests
 
+RSSI_PARAMS = ['file', 'exec', {'command': 'gsmctl', 'params': ['-q']}]
+SERVING_PARAMS = ['file', 'exec', {'command': 'gsmctl', 'params': ['--serving']}]
+# Counting the comma separated fields after '"LTE",' or '"GSM",' in the
+# serving cell reply, LTE has mcc, mnc and cell id (hex) as field 2-4 and lac
+# (hex) as field 10, GSM has mcc, mnc, lac (hex) and cell id (hex) as field 1-4
+LTE_SERVING_CELL = re.compile(
+    r'LTE.{2}[^,]*,([^,]*),([^,]*),([0-9A-Fa-f]+),(?:[^,]*,){5}([0-9A-Fa-f]+)'
+)
+GSM_SERVING_CELL = re.compile(r'GSM.{2}([^,]*),([^,]*),([0-9A-Fa-f]+),([0-9A-Fa-f]+)')
+
 
 class TeltonikaRut(object):
     def __init__(self, passwd, ip_address='192.168.1.1'):
         self.ip = ip_address
         self.passwd = passwd
+        # Reuse one HTTP connection for all calls
+        self._http = requests.Session()
+        self._http.headers.update({'Content-Type': 'application/json'})
+        self._url = 'http://{}/ubus'.format(self.ip)
         self.session = '00000000000000000000000000000000'
         self.session = self.init_session()
 
-    def _comm(self, params):
+    def _payload(self, params, call_id=1):
         payload = {
             'jsonrpc': '2.0',
-            'id': 1,
+            'id': call_id,
             'method': 'call'
         }
         payload.update(
             {'params': [self.session] + params}
         )
-        url = 'http://{}/ubus'.format(self.ip)
-        r = requests.post(url, data=json.dumps(payload))
+        return payload
+
+    def _comm(self, params):
+        payload = self._payload(params)
+        r = self._http.post(self._url, data=json.dumps(payload))
         reply = r.json()
         result = reply['result']
         return result
 
+    def _comm_batch(self, params_list):
+        """
+        Perform several calls in one request, using the JSON-RPC batch
+        form. The results are returned in the same order as params_list.
+        """
+        payload = [self._payload(params, call_id)
+                   for call_id, params in enumerate(params_list)]
+        r = self._http.post(self._url, data=json.dumps(payload))
+        # The replies are not guaranteed to be in the same order as the calls
+        results = {reply['id']: reply['result'] for reply in r.json()}
+        return [results[call_id] for call_id in range(len(params_list))]
+
     def init_session(self):
         params = ['session', 'login', {'username': 'root', 'password': self.passwd}]
         reply = self._comm(params)
@@ -49,38 +79,43 @@ class TeltonikaRut(object):
         """
         Obtain signal strength
         """
-        params = [
-            'file', 'exec', {'command': 'gsmctl', 'params': ["-q"]}
-        ]
-        reply = self._comm(params)
+        reply = self._comm(RSSI_PARAMS)
         rssi = int(reply[1]['stdout'])
         return rssi
 
     def cell_information(self):
-        params = [
-            'file', 'exec', {'command': 'gsmctl', 'params': ["--serving"]}
-        ]
-        reply = self._comm(params)
-        info = reply[1]['stdout']
+        reply = self._comm(SERVING_PARAMS)
+        return self._parse_cell_information(reply[1]['stdout'])
 
-        if info.find('LTE') > 0:
-            pos = info.find('LTE') + 5
-            data = info[pos:].split(',')
+    def poll_all(self):
+        """
+        Obtain both signal strength and cell information in one request
+        """
+        rssi_reply, serving_reply = self._comm_batch([RSSI_PARAMS, SERVING_PARAMS])
+        values = {
+            'rssi': int(rssi_reply[1]['stdout']),
+            'cell_information': self._parse_cell_information(serving_reply[1]['stdout'])
+        }
+        return values
+
+    @staticmethod
+    def _parse_cell_information(info):
+        lte = LTE_SERVING_CELL.search(info)
+        gsm = None if lte else GSM_SERVING_CELL.search(info)
+        if lte:
             cell_info = {
-                'mcc': data[1],
-                'mnc': data[2],
-                'lac':  int(data[9], 16),
-                'cell_id': int(data[3], 16)
+                'mcc': lte.group(1),
+                'mnc': lte.group(2),
+                'lac':  int(lte.group(4), 16),
+                'cell_id': int(lte.group(3), 16)
             }
 
-        elif info.find('GSM') > 0:
-            pos = info.find('GSM') + 5
-            data = info[pos:].split(',')
+        elif gsm:
             cell_info = {
-                'mcc': data[0],
-                'mnc': data[1],
-                'lac': int(data[2], 16),
-                'cell_id': int(data[3], 16)
+                'mcc': gsm.group(1),
+                'mnc': gsm.group(2),
+                'lac': int(gsm.group(3), 16),
+                'cell_id': int(gsm.group(4), 16)
             }
         else:  # Unsupported network, or no SIM at all
             cell_info = {
@@ -103,6 +138,8 @@ if __name__ == '__main__':
     print(tr.rssi())
     print()
     print(tr.cell_information())
+    print()
+    print(tr.poll_all())
 
     print()
     print('Sending SMS')
@@ -125,8 +125,17 @@ class CPXServer(object):
                                   callback=self.handle_command)
 
     def handle_command(self, kwargs):
-        """Call back function that will be called when a request is received"""
+        """Call back function that will be called when a request is received
+
+        If the request has a sequence number, 'seq', the return value is [seq, value], so
+        that the client can match the reply to the request
+        """
         LOG.debug('Got command: %s', kwargs)
+        if 'seq' in kwargs:
+            kwargs = dict(kwargs)
+            seq = kwargs.pop('seq')
+            return [seq, self.handle_command(kwargs)]
+
         command = kwargs.get('command')
 
         # Test if we asked it to stop
@@ -138,6 +147,17 @@ class CPXServer(object):
         if command == 'PING':
             return 'PONG'
 
+        # Execute a list of commands on the same power supply and output in one
+        # request and return the list of results
+        if command == 'batch':
+            results = []
+            for sub_command in kwargs.get('arg', []):
+                sub_kwargs = {'power_supply': kwargs.get('power_supply'),
+                              'output': kwargs.get('output')}
+                sub_kwargs.update(sub_command)
+                results.append(self.handle_command(sub_kwargs))
+            return results
+
         if command not in self.accepted_commands:
             msg = 'ERROR: Invalid command: %s'
             LOG.error(msg, command)
@@ -185,6 +205,9 @@ class CPXServer(object):
             else:
                 out = function()
                 LOG.debug(cmd_msg, command, None, cpx.hostname, cpx.output, out)
+            # Return the output status as a bool rather than the raw '0' or '1' reply
+            if command == 'read_output_status':
+                out = out.strip() == '1'
         except Exception:
             LOG.exception("An error occured during execution of command on CPX")
             raise
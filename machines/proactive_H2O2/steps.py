@@ -24,7 +24,11 @@ along with The CINF Data Presentation Website.  If not, see
 
 """
 
-from time import time
+try:
+    from time import monotonic
+except ImportError:
+    # Python 2
+    from time import time as monotonic
 from yaml import load
 
 
@@ -46,11 +50,11 @@ class ConstantStepBase(object):
 
     def start(self):
         """Start this step"""
-        self._start = time()
+        self._start = monotonic()
 
     def stop(self):
         """Stop the step"""
-        self._elapsed = time() - self._start
+        self._elapsed = monotonic() - self._start
         self._start = None
 
     def elapsed(self):
@@ -58,7 +62,7 @@ class ConstantStepBase(object):
         if self._start is None:
             return self._elapsed
         else:
-            return time() - self._start
+            return monotonic() - self._start
 
     def remaining(self):
         """Return remaining time"""
@@ -31,19 +31,32 @@ import sys
 import socket
 import json
 from time import time, sleep
-from threading import Thread
-from functools import partial
-import subprocess
 try:
-    from queue import Queue
+    from time import monotonic
 except ImportError:
-    from Queue import Queue
+    # Python 2
+    from time import time as monotonic
+from threading import Thread, Event
+from collections import deque
+from itertools import count
+import subprocess
 import argparse
 from pprint import pformat
 import traceback
 
+try:
+    from math import isclose
+except ImportError:
+    # Python 2
+    def isclose(a, b, rel_tol=1e-09, abs_tol=0.0):  # pylint: disable=invalid-name
+        """Return whether a and b are close, like math.isclose on Python 3"""
+        return abs(a - b) <= max(rel_tol * max(abs(a), abs(b)), abs_tol)
+
 # Import third party
-from numpy import isclose
+try:
+    import orjson
+except ImportError:
+    orjson = None  # pylint: disable=invalid-name
 from PyQt4.QtGui import QApplication  # pylint: disable=no-name-in-module
 
 # Import from PyExpLabSys
@@ -66,9 +79,20 @@ LOG = None
 # Setup communication with the power supply server
 HOST, PORT = "localhost", 8500
 SOCK = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+# Connect, so that replies from other sources are dropped by the kernel
+SOCK.connect((HOST, PORT))
 SOCK.settimeout(5)
-def _send_command(output, power_supply, command, arg=None):
-    """Send a command to the power supply server
+# Timeout for the replies once the server is known to be up. It is generous, since the
+# server retries internally (and re-inits the CPX) on communication errors
+COMMAND_TIMEOUT = 30
+# The interval with which the buffered points are saved to the database
+SAVE_INTERVAL = 1.0
+# Sequence numbers for the requests, which the server returns with the reply
+SEQUENCE_NUMBERS = count()
+
+
+def _format_command(output, power_supply, command, arg=None):
+    """Return the formatted request for a command to the power supply server
 
     Args:
         output (str): The output number in a string; either 1 or 2
@@ -76,22 +100,119 @@ def _send_command(output, power_supply, command, arg=None):
         command (str): The command/name of the method to call on the power
             supply object
         arg (object): The argument to the command/method
+
+    Returns:
+        bytes: The request, ready to be sent with :func:`_send_formatted`
     """
     data_to_send = {'command': command, 'output': output,
                     'power_supply': power_supply}
     if arg is not None:
         data_to_send['arg'] = arg
-    formatted_command = b'json_wn#' + json.dumps(data_to_send).encode('utf-8')
+    if orjson is not None:
+        return b'json_wn#' + orjson.dumps(data_to_send)
+    return b'json_wn#' + json.dumps(data_to_send).encode('utf-8')
+
+
+def _format_batch(output, power_supply, commands):
+    """Return the formatted request for a batch of commands
+
+    The commands are sent as a single 'batch' command, which the server
+    executes in order, so that e.g. all the reads in one iteration of the
+    main loop only cost one round trip.
+
+    Args:
+        output (str): The output number in a string; either 1 or 2
+        power_supply (str): The power supply name e.g. 'A'
+        commands (sequence): The commands to execute. Each item is either a
+            command name or a (command, arg) tuple
+
+    Returns:
+        bytes: The request, ready to be sent with :func:`_send_formatted_batch`
+    """
+    batch = []
+    for command in commands:
+        if isinstance(command, tuple):
+            command, arg = command
+            batch.append({'command': command, 'arg': arg})
+        else:
+            batch.append({'command': command})
+    return _format_command(output, power_supply, 'batch', batch)
+
+
+def _loads(data):
+    """Decode JSON bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode('utf-8'))
+
+
+def _send_formatted(formatted_command):
+    """Send a formatted request to the power supply server and return the reply
 
-    SOCK.sendto(formatted_command, (HOST, PORT))
-    received = SOCK.recv(1024).decode('utf-8')
-    LOG.debug('Send %s. Got: %s', data_to_send, received)
+    Each request gets a sequence number, which the server returns along with the value.
+    Replies with another sequence number are late replies to earlier requests (e.g. after
+    a re-send) and are discarded, as are malformed replies.
 
-    if received.startswith('ERROR:'):
-        raise PowerSupplyComException(received)
+    Raises:
+        PowerSupplyComException: If the server returns an error or does not reply
+            within the timeout, also after one re-send of the command
+    """
+    seq = next(SEQUENCE_NUMBERS)
+    # The formatted command is a JSON object, so add the sequence number before the
+    # closing brace, to be able to use preformatted commands
+    request = formatted_command[:-1] + b', "seq": ' + str(seq).encode('ascii') + b'}'
+
+    # All the commands are idempotent, so it is safe to re-send on a timeout
+    for attempt in range(2):
+        try:
+            SOCK.send(request)
+            while True:
+                received = SOCK.recv(1024)
+                LOG.debug('Send %s. Got: %s', request, received)
+                if not received.startswith(b'RET#'):
+                    # An ERROR# or EXCEP# reply from the server
+                    raise PowerSupplyComException(received.decode('utf-8'))
+                try:
+                    reply_seq, value = _loads(received[4:])
+                except (ValueError, TypeError):
+                    LOG.warning('Discarded malformed reply: %s', received)
+                    continue
+                if reply_seq == seq:
+                    break
+                LOG.debug('Discarded reply with seq %s, waiting for %s', reply_seq, seq)
+            break
+        # On the connected socket, a server that is not running shows up as connection
+        # refused rather than as a timeout
+        except socket.error as exception:
+            LOG.warning('No reply to %s on attempt %s: %s', request, attempt, exception)
+    else:
+        message = 'No reply from the power supply server to: {}'.format(request)
+        raise PowerSupplyComException(message)
+
+    if str(value).startswith('ERROR:'):
+        raise PowerSupplyComException(value)
+    return value
+
+
+def _send_formatted_batch(formatted_batch):
+    """Send a formatted batch request and return the list of return values
+
+    Raises:
+        PowerSupplyComException: If any of the commands returned an error
+    """
+    values = _send_formatted(formatted_batch)
+    for value in values:
+        if str(value).startswith('ERROR:'):
+            raise PowerSupplyComException(value)
+    return values
 
-    # The return values starts with RET#
-    return json.loads(received[4:])
+
+def _send_command(output, power_supply, command, arg=None):
+    """Send a command to the power supply server
+
+    See :func:`_format_command` for the arguments
+    """
+    return _send_formatted(_format_command(output, power_supply, command, arg))
 
 
 class PowerSupplyComException(Exception):
@@ -169,8 +290,9 @@ class VoltageCurrentProgram(Thread):  # pylint: disable=too-many-instance-attrib
                 ]
             }
         }
-        # Queue for GUI updates
-        self.message_queue = Queue()
+        # Queue for GUI updates. The GUI merges the status updates, so only a bound on
+        # the length is needed, in case the GUI stalls
+        self.message_queue = deque(maxlen=256)
         # The GUI also looks in self.config, see below
 
         ### Normal program
@@ -181,6 +303,8 @@ class VoltageCurrentProgram(Thread):  # pylint: disable=too-many-instance-attrib
         self.say('Using power supply channel: ' + self.channel_id)
         self.say('Loaded with config:\n' + pformat(self.config))
         self.active_step = 0
+        # The str representations of the steps, only updated for the edited step
+        self.step_strings = [str(step) for step in self.steps]
         self.send_steps()
 
         # Add completions for the edits
@@ -195,15 +319,14 @@ class VoltageCurrentProgram(Thread):  # pylint: disable=too-many-instance-attrib
         self.status = {'status_field': 'Initialized'}
 
         # General variables
-        self.stop = False
-        self.ok_to_start = False
-
-        # Create a partial function with the output substitued in
-        self.send_command = partial(
-            _send_command,
-            args.output,
-            args.power_supply,
-        )
+        self.start_event = Event()
+        self.stop_event = Event()
+        # Set on edits, to have the main loop recalculate the totals for the other steps
+        self.steps_edited = False
+
+        # The power supply and output that commands are sent to
+        self.power_supply = args.power_supply
+        self.output = args.output
         # Setup power supply
         self.power_supply_on_off(True, self.config['maxcurrent_start'])
         # Power supply commands, must match order with self.codenames
@@ -211,11 +334,14 @@ class VoltageCurrentProgram(Thread):  # pylint: disable=too-many-instance-attrib
             'read_actual_current', 'read_actual_voltage', 'read_set_voltage',
             'read_current_limit'
         )
+        # The request for the reads never changes, so format it only once
+        self.read_request = _format_batch(
+            self.output, self.power_supply, self.power_supply_commands,
+        )
 
         # Setup dataset saver and live socket
-        self.codenames = [self.channel_id + id_ for id_ in
-                          ('_current', '_voltage', '_voltage_setpoint',
-                           '_current_limit')]
+        self.labels = ('current', 'voltage', 'voltage_setpoint', 'current_limit')
+        self.codenames = [self.channel_id + '_' + label for label in self.labels]
         self.live_socket = LiveSocket(
             'H2O2_proactive_' + self.channel_id,
             self.codenames + [self.channel_id + '_accum_charge'],
@@ -229,6 +355,9 @@ class VoltageCurrentProgram(Thread):  # pylint: disable=too-many-instance-attrib
             username=credentials.username, password=credentials.password
         )
         self.data_set_saver.start()
+        # Points waiting to be saved, as (codename, point) pairs
+        self.points_to_save = []
+        self.last_save = monotonic()
 
         # Done with init, send status
         self.send_status()
@@ -236,9 +365,9 @@ class VoltageCurrentProgram(Thread):  # pylint: disable=too-many-instance-attrib
     def command(self, command, args_str):
         """Process commands from the GUI"""
         if command == 'stop':  # stop is sent on quit
-            self.stop = True
+            self.stop_event.set()
         elif command == 'start':
-            self.ok_to_start = True
+            self.start_event.set()
         elif command == 'edit':
             # Parse the edit line, start by splitting up in step_num, field and value
             try:
@@ -267,9 +396,11 @@ class VoltageCurrentProgram(Thread):  # pylint: disable=too-many-instance-attrib
                 return
 
             # Finally send the new steps to the GUI
+            self.steps_edited = True
+            self.step_strings[int(num_step)] = str(step)
             self.send_steps()
         elif command == "psuchannel":
-            if self.ok_to_start and not self.stop:
+            if self.start_event.is_set() and not self.stop_event.is_set():
                 message = "Using psuchannel during ramp not allowed"
                 self.say(message, message_type='error')
                 return
@@ -297,26 +428,50 @@ class VoltageCurrentProgram(Thread):  # pylint: disable=too-many-instance-attrib
         """Send the status to the GUI"""
         if update_dict:
             self.status.update(update_dict)
-        self.message_queue.put(('status', self.status.copy()))
+        self.message_queue.append(('status', self.status.copy()))
 
     def send_steps(self):
         """Send the steps list to the GUI"""
-        steps = [(index == self.active_step, str(step))
-                 for index, step in enumerate(self.steps)]
-        self.message_queue.put(('steps', steps))
+        steps = [(index == self.active_step, step_string)
+                 for index, step_string in enumerate(self.step_strings)]
+        self.message_queue.append(('steps', steps))
+
+    def send_active_step(self):
+        """Send the index of the active step to the GUI"""
+        self.message_queue.append(('active_step', self.active_step))
+
+    def send_command(self, command, arg=None):
+        """Send a command to the power supply server for this power supply and output
+
+        See :func:`_format_command` for the arguments
+        """
+        return _send_formatted(
+            _format_command(self.output, self.power_supply, command, arg)
+        )
+
+    def send_commands_batch(self, commands):
+        """Send several commands to the power supply server in one request
+
+        See :func:`_format_batch` for the arguments
+
+        Returns:
+            list: The return values of the commands, in order
+        """
+        return _send_formatted_batch(
+            _format_batch(self.output, self.power_supply, commands)
+        )
 
     def say(self, text, message_type='message'):
         """Send a ordinary text message to the gui"""
-        self.message_queue.put((message_type, text))
+        self.message_queue.append((message_type, text))
 
     def run(self):
         """The MAIN run method"""
         # Wait for start
-        while not self.ok_to_start:
-            if self.stop:
+        while not self.start_event.wait(0.1):
+            if self.stop_event.is_set():
                 self.send_status({'status_field': 'Stopped'})
                 return
-            sleep(0.1)
 
         # Start
         self.send_status({'status_field': 'Starting'})
@@ -324,12 +479,23 @@ class VoltageCurrentProgram(Thread):  # pylint: disable=too-many-instance-attrib
 
         # Run the MAIN measurement loop
         # (This is where most of the time is spent)
-        self.main_measure()
-
-        # Shutdown powersupply, livesocket and possibly server
-        self.send_status({'status_field': 'Stopping'})
-        self.stop_everything()
-        self.send_status({'status_field': 'Stopped'})
+        try:
+            self.main_measure()
+        except Exception as exception:  # pylint: disable=broad-except
+            LOG.exception('Exception in the main measurement loop')
+            self.say('The program failed with: {}'.format(exception), message_type='error')
+            # Do not leave the power supply on at the last setpoint
+            try:
+                self.power_supply_on_off(False)
+                self.say('Power supply output set to off')
+            except Exception:  # pylint: disable=broad-except
+                LOG.exception('Unable to set the power supply output off')
+                self.say('Unable to set the power supply output off', message_type='error')
+        finally:
+            # Shutdown powersupply, livesocket and possibly server
+            self.send_status({'status_field': 'Stopping'})
+            self.stop_everything()
+            self.send_status({'status_field': 'Stopped'})
 
         sleep(0.1)
         self.say("I have stopped")
@@ -337,10 +503,10 @@ class VoltageCurrentProgram(Thread):  # pylint: disable=too-many-instance-attrib
     def setup_data_set_saver(self):
         """Setup the data set saver"""
         sql_time = CustomColumn(time(), 'FROM_UNIXTIME(%s)')
-        for codename in self.codenames:
+        for codename, label in zip(self.codenames, self.labels):
             metadata = {
                 'time': sql_time, 'comment': self.config['comment'],
-                'label': codename[3:], 'type': 1,
+                'label': label, 'type': 1,
                 'power_supply_channel': self.channel_id,
             }
             self.data_set_saver.add_measurement(codename, metadata)
@@ -351,11 +517,13 @@ class VoltageCurrentProgram(Thread):  # pylint: disable=too-many-instance-attrib
         # Initial setup
         last_set_voltage = None
         last_set_max_current = None
-        last_time = time()
+        last_time = monotonic()
         iteration_time = 'N/A'
-        self.status['elapsed'] = 0.0
+        # Local aliases for the attributes used in every iteration
+        status = self.status
+        status['elapsed'] = 0.0
         accum_charge_codename = self.channel_id + '_accum_charge'
-        self.status[accum_charge_codename] = 0.0
+        status[accum_charge_codename] = 0.0
         current_id = self.channel_id + '_current'
         last_measured_current = 0.0
 
@@ -365,57 +533,63 @@ class VoltageCurrentProgram(Thread):  # pylint: disable=too-many-instance-attrib
             # Also give the step an instance name (for steps list)
             if self.active_step > 0:
                 self.say('Switched to step: {}'.format(self.active_step))
-            self.send_steps()
+            self.send_active_step()
             current_step.start()
+            other_elapsed, other_remaining = self._other_steps_totals()
 
             # While the step hasn't completed yet
             while current_step.elapsed() < current_step.duration:
                 # Check if we should stop
-                if self.stop:
+                if self.stop_event.is_set():
                     self.say('I have been asked to stop')
                     return
 
-                iteration_start = now = time()
+                iteration_start = now = monotonic()
                 # Calculate the time for one iteration and update times in status
                 iteration_time = now - last_time
 
                 last_time = now
-                self.status.update({
-                    'elapsed': current_step.elapsed(),
-                    'remaining': current_step.remaining(),
-                    'iteration_time': iteration_time,
-                    'elapsed_total': sum(step.elapsed() for step in self.steps),
-                    'remaining_total': sum(step.remaining() for step in self.steps),
-                })
+                # The totals for the other steps only change on edits
+                if self.steps_edited:
+                    self.steps_edited = False
+                    other_elapsed, other_remaining = self._other_steps_totals()
+                elapsed = current_step.elapsed()
+                remaining = current_step.duration - elapsed
+                status['elapsed'] = elapsed
+                status['remaining'] = remaining
+                status['iteration_time'] = iteration_time
+                status['elapsed_total'] = elapsed_total = other_elapsed + elapsed
+                status['remaining_total'] = other_remaining + remaining
 
                 # Ask the power supply to set a new voltage if needed
                 required_voltage, required_max_current = current_step.values()
+                set_commands = []
                 if required_max_current != last_set_max_current:
-                    self.send_command('set_current_limit', required_max_current)
+                    set_commands.append(('set_current_limit', required_max_current))
                     last_set_max_current = required_max_current
                 if required_voltage != last_set_voltage:
-                    self.send_command('set_voltage', required_voltage)
+                    set_commands.append(('set_voltage', required_voltage))
                     last_set_voltage = required_voltage
 
-                # Read value from the power supply
-                self._read_values_from_power_supply()
+                # Read value from the power supply (in the same request as the sets)
+                self._read_values_from_power_supply(set_commands)
 
                 # Calculate, set and send accumulated charge
+                measured_current = status[current_id]
                 charge_addition = \
-                    (last_measured_current + self.status[current_id])\
-                    / 2 * iteration_time
-                last_measured_current = self.status[current_id]
-                self.status[accum_charge_codename] += charge_addition
-                point = (self.status['elapsed_total'], self.status[accum_charge_codename])
+                    (last_measured_current + measured_current) / 2 * iteration_time
+                last_measured_current = measured_current
+                status[accum_charge_codename] += charge_addition
+                point = (elapsed_total, status[accum_charge_codename])
                 self.live_socket.set_point(accum_charge_codename, point)
 
                 # Send the new status
                 self.send_status()
 
                 # Calculate time to sleep to use the proper probe interval
-                time_to_sleep = current_step.probe_interval - (time() - iteration_start)
+                time_to_sleep = current_step.probe_interval - (monotonic() - iteration_start)
                 if time_to_sleep > 0:
-                    sleep(time_to_sleep)
+                    self.stop_event.wait(time_to_sleep)
 
             # Stop the step(s own time keeping)
             current_step.stop()
@@ -425,37 +599,72 @@ class VoltageCurrentProgram(Thread):  # pylint: disable=too-many-instance-attrib
         self.say('Stepped program completed')
 
 
-    def _read_values_from_power_supply(self):
-        """Read all required values from the power supply (used only from run)"""
-        for command, codename in zip(self.power_supply_commands, self.codenames):
-            # Get a value for the current command
-            value = self.send_command(command)
-
-            # Set/save it on the live_socket, database and in the GUI
-            point = (self.status['elapsed_total'], value)
-            self.live_socket.set_point(codename, point)
-            self.data_set_saver.save_point(codename, point)
-            self.status[codename] = value
+    def _other_steps_totals(self):
+        """Return the total elapsed and remaining time for all but the active step"""
+        other_steps = self.steps[:self.active_step] + self.steps[self.active_step + 1:]
+        return (sum(step.elapsed() for step in other_steps),
+                sum(step.remaining() for step in other_steps))
+
+    def _read_values_from_power_supply(self, set_commands=None):
+        """Read all required values from the power supply (used only from run)
+
+        Args:
+            set_commands (list): Optional list of (command, arg) tuples to execute before
+                the reads, in the same request
+        """
+        # Get the values for all the commands in one request
+        if set_commands:
+            commands = set_commands + list(self.power_supply_commands)
+            values = self.send_commands_batch(commands)[len(set_commands):]
+        else:
+            values = _send_formatted_batch(self.read_request)
+        status = self.status
+        elapsed_total = status['elapsed_total']
+        points = {}
+        for codename, value in zip(self.codenames, values):
+            points[codename] = (elapsed_total, value)
+            status[codename] = value
+
+        # Set all the points on the live_socket at once, and buffer them for the database
+        self.live_socket.set_batch(points)
+        self.points_to_save.extend(points.items())
+        if monotonic() - self.last_save >= SAVE_INTERVAL:
+            self.save_points()
+
+    def save_points(self):
+        """Save the buffered points to the database in one batch"""
+        self.data_set_saver.save_points(self.points_to_save)
+        self.points_to_save = []
+        self.last_save = monotonic()
 
     def stop_everything(self):
-        """Stop power supply and live socket"""
-        self.live_socket.stop()
-        self.data_set_saver.stop()
+        """Stop power supply and live socket
+
+        The buffered points are saved first, and the live socket and data set saver
+        are stopped even if that fails
+        """
+        try:
+            self.save_points()
+        finally:
+            self.live_socket.stop()
+            self.data_set_saver.stop()
 
     def power_supply_on_off(self, state, current_limit=None):
         """Set power supply on off"""
         LOG.debug('Stop power supply')
 
-        # Set current limit
+        # Set current limit, and read it back in the same request
         if current_limit is not None:
-            self.send_command('set_current_limit', current_limit)
-            read_current_limit = self.send_command('read_current_limit')
-            if not isclose(read_current_limit, current_limit):
+            _, read_current_limit = self.send_commands_batch(
+                [('set_current_limit', current_limit), 'read_current_limit']
+            )
+            if not isclose(read_current_limit, current_limit, rel_tol=1e-5, abs_tol=1e-8):
                 raise RuntimeError('Unable to set current limit')
 
-        # Set state
-        self.send_command('output_status', state)
-        read_state = self.send_command('read_output_status').strip() == '1'
+        # Set state, and read it back in the same request
+        _, read_state = self.send_commands_batch(
+            [('output_status', state), 'read_output_status']
+        )
         if not read_state is state:
             raise RuntimeError('Could not set output state')
 
@@ -500,9 +709,15 @@ def main():
         pass
 
     # Check if the server is up
-    if _send_command("1", args.power_supply, 'PING') == 'PONG':
+    try:
+        pong = _send_command("1", args.power_supply, 'PING')
+    except PowerSupplyComException:
+        print('Unable to connect to the power supply server. '
+              'Did you remember to start it?')
+        return
+    if pong == 'PONG':
         LOG.debug('Got PONG from server')
-    SOCK.settimeout(None)
+    SOCK.settimeout(COMMAND_TIMEOUT)
 
     # Init program
     my_program = VoltageCurrentProgram(args)
@@ -521,9 +736,6 @@ def main():
 
 try:
     main()
-except socket.timeout:
-    print('Unable to connect to the power supply server. '
-          'Did you remember to start it?')
 except Exception as exc:
     EXCEPTION_TEXT = traceback.format_exc()
     import datetime
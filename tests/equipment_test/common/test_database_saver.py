@@ -92,6 +92,34 @@ class TestDataSetSaver(object):
             assert np.allclose(x_values, data[:, 0])
             assert np.allclose(y_values, data[:, 1])
 
+    def test_save_points(self, db_saver, data_for_tests, metadata_for_tests):
+        """Test the save_points method"""
+        # Unpack data and metadata
+        x_values, y0_values, y1_values = data_for_tests
+        codenames, metadata_sets = metadata_for_tests
+
+        # Add the measurements
+        for codename, metadata in zip(codenames, metadata_sets):
+            db_saver.add_measurement(codename, metadata)
+
+        # Save the test data
+        for x_value, y0_value, y1_value in zip(x_values, y0_values, y1_values):
+            db_saver.save_points({'sine_to_time': (x_value, y0_value),
+                                  'sine_to_time_plus_pi': (x_value, y1_value)})
+
+        # Make sure the queue has emptied
+        while db_saver.sql_saver.queue.qsize() > 0:
+            time.sleep(0.01)
+
+        # Check if the data got there
+        query = 'SELECT x, y from xy_values_dummy WHERE measurement={} ORDER BY id asc'
+        for codename, y_values in zip(codenames, (y0_values, y1_values)):
+            CURSOR.execute(query.format(db_saver.measurement_ids[codename]))
+            data = np.array(CURSOR.fetchall())
+            assert data.shape == (self.number_of_points, 2)
+            assert np.allclose(x_values, data[:, 0])
+            assert np.allclose(y_values, data[:, 1])
+
     @pytest.mark.parametrize("batchsize", (batch_good, batch_bad),
                              ids=['does not fit batches', 'fits batches'])
     def test_save_points_batch(self, db_saver, data_for_tests, metadata_for_tests, batchsize):
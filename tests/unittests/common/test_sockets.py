@@ -41,7 +41,11 @@ SOCKET_NAME = 'my_socket'
 FIRTS_MEASUREMENT_NAME = 'my_measurement'
 SECOND_MEASUREMENT_NAME = 'my_measurement2'
 CODENAMES = [FIRTS_MEASUREMENT_NAME, SECOND_MEASUREMENT_NAME]
-SINGLE_DATA = {PORT: {'data': {FIRTS_MEASUREMENT_NAME: (42.0, 47.0)}}}
+SINGLE_DATA = {PORT: {
+    'data': {FIRTS_MEASUREMENT_NAME: (42.0, 47.0)},
+    '_timeouts': [None],
+    '_codename_index': {FIRTS_MEASUREMENT_NAME: 0},
+}}
 ALL_DATA = {PORT: {
     'data': {
         FIRTS_MEASUREMENT_NAME: (42.0, 47.0),
@@ -49,9 +53,21 @@ ALL_DATA = {PORT: {
     },
     'name': NAME,
     'codenames': [FIRTS_MEASUREMENT_NAME, SECOND_MEASUREMENT_NAME],
+    '_raw_wn_templates': [
+        (FIRTS_MEASUREMENT_NAME + ':%s,%s', FIRTS_MEASUREMENT_NAME + ':OLD_DATA'),
+        (SECOND_MEASUREMENT_NAME + ':%s,%s', SECOND_MEASUREMENT_NAME + ':OLD_DATA'),
+    ],
+    '_codenames_raw_bytes': ','.join(CODENAMES).encode('ascii'),
+    '_codenames_json_bytes': json.dumps(CODENAMES).encode('ascii'),
+    '_timeouts': [None, 1.0],
+    '_has_timeouts': True,
+    '_codename_index': {FIRTS_MEASUREMENT_NAME: 0, SECOND_MEASUREMENT_NAME: 1},
 }}
+SINGLE_ENTRY = SINGLE_DATA[PORT]
+ALL_ENTRY = ALL_DATA[PORT]
 SOCKETS_PATH = 'PyExpLabSys.common.sockets.{}'
 ANY_RETURN = 'any_return_value'
+NOW = 1E9
 
 
 ### Fixtures
@@ -110,15 +126,11 @@ def cdps_init_args():
 
 
 @pytest.fixture
-def udp_server():
-    """A UDPServer fixure"""
-    if sys.version_info[0] == 2:
-        with mock.patch('SocketServer.UDPServer') as udp_server:
-            yield udp_server
-    # SocketServer was renamed to socketserver in Python 3
-    else:
-        with mock.patch('socketserver.UDPServer') as udp_server:
-            yield udp_server
+def pull_udp_server():
+    """A PullUDPServer fixture"""
+    with mock.patch(SOCKETS_PATH.format('PullUDPServer')) as pull_udp_server:
+        yield pull_udp_server
+
 
 @pytest.fixture
 def clean_data():
@@ -189,13 +201,59 @@ def test_socket_server_status():
     sockets.DATA = old_data
 
 
+@pytest.mark.parametrize("use_orjson", [True, False], ids=['orjson', 'json'])
+def test_json_bytes(use_orjson):
+    """Test that _json_bytes returns the same compact json bytes with and without orjson"""
+    if use_orjson:
+        pytest.importorskip('orjson')
+        out = sockets._json_bytes({'a': [1.0, 'b', True]})
+    else:
+        with mock.patch(SOCKETS_PATH.format('orjson'), None):
+            out = sockets._json_bytes({'a': [1.0, 'b', True]})
+    assert out == b'{"a":[1.0,"b",true]}'
+
+
+def test_json_bytes_fallback():
+    """Test that _json_bytes falls back to json for objects orjson cannot serialize"""
+    orjson = mock.MagicMock()
+    orjson.dumps.side_effect = TypeError
+    with mock.patch(SOCKETS_PATH.format('orjson'), orjson):
+        assert sockets._json_bytes([1.0]) == b'[1.0]'
+
+
+@pytest.mark.parametrize("use_orjson", [True, False], ids=['orjson', 'json'])
+def test_json_bytes_non_finite(use_orjson):
+    """Test that _json_bytes encodes NaN and infinity the same with and without orjson"""
+    value = [float('nan'), float('inf'), -float('inf'), None]
+    if use_orjson:
+        pytest.importorskip('orjson')
+        out = sockets._json_bytes(value)
+    else:
+        with mock.patch(SOCKETS_PATH.format('orjson'), None):
+            out = sockets._json_bytes(value)
+    assert out == b'[NaN,Infinity,-Infinity,null]'
+
+
+@pytest.mark.parametrize("use_orjson", [True, False], ids=['orjson', 'json'])
+def test_json_bytes_non_ascii(use_orjson):
+    """Test that _json_bytes escapes non-ASCII characters with and without orjson"""
+    value = {'a': [1.0, '\u00b5A']}
+    if use_orjson:
+        pytest.importorskip('orjson')
+        out = sockets._json_bytes(value)
+    else:
+        with mock.patch(SOCKETS_PATH.format('orjson'), None):
+            out = sockets._json_bytes(value)
+    assert out == b'{"a":[1.0,"\\u00b5A"]}'
+
+
 class TestPullUDPHandler(object):
     """Test the PullUDPHandler"""
 
-    def test_handle_single_val_and_port(self, mocket, server):
+    def test_handle_single_val_and_port(self, mocket, server, sockets_data_all):
         """Test the handle method single value case"""
         request = b'dummy#request'
-        mock_return_value = 'mock return value'
+        mock_return_value = b'mock return value'
 
         # mock handle, which is called at instantiate time, inside a try except
         with mock.patch(SOCKETS_PATH.format('PullUDPHandler.handle')):
@@ -205,18 +263,21 @@ class TestPullUDPHandler(object):
         with mock.patch(SOCKETS_PATH.format('PullUDPHandler._single_value')) as _single_value:
             _single_value.return_value = mock_return_value
             with mock.patch(SOCKETS_PATH.format('PullUDPHandler._all_values')) as _all_values:
-                handler.handle()
-                _single_value.assert_called_once_with(request.decode('ascii'))
+                with mock.patch('time.time') as time_:
+                    time_.return_value = NOW
+                    handler.handle()
+                _single_value.assert_called_once_with(request.decode('ascii'),
+                                                      sockets_data_all[PORT], NOW)
                 assert not _all_values.called
-                mocket.sendto.assert_called_once_with(mock_return_value.encode('ascii'),
+                mocket.sendto.assert_called_once_with(mock_return_value,
                                                       CLIENT_ADDRESS)
 
         assert handler.port == PORT
 
-    def test_handle_all_value(self, mocket, server):
+    def test_handle_all_value(self, mocket, server, sockets_data_all):
         """Test the handle method all values case"""
         request = b'dummy_request'
-        mock_return_value = 'mock return value'
+        mock_return_value = b'mock return value'
 
         # mock handle, which is called at instantiate time, inside a try except
         with mock.patch(SOCKETS_PATH.format('PullUDPHandler.handle')):
@@ -226,102 +287,147 @@ class TestPullUDPHandler(object):
         with mock.patch(SOCKETS_PATH.format('PullUDPHandler._single_value')) as _single_value:
             with mock.patch(SOCKETS_PATH.format('PullUDPHandler._all_values')) as _all_values:
                 _all_values.return_value = mock_return_value
-                handler.handle()
-                _all_values.assert_called_once_with(request.decode('ascii'))
+                with mock.patch('time.time') as time_:
+                    time_.return_value = NOW
+                    handler.handle()
+                _all_values.assert_called_once_with(request.decode('ascii'),
+                                                    sockets_data_all[PORT], NOW)
                 assert not _single_value.called
-                mocket.sendto.assert_called_once_with(mock_return_value.encode('ascii'),
+                mocket.sendto.assert_called_once_with(mock_return_value,
                                                       CLIENT_ADDRESS)
 
     def test_single_raw(self, pull_udp_handler, sockets_data_single):
         """Test the _single_value raw case"""
         with mock.patch(SOCKETS_PATH.format('PullUDPHandler._old_data')) as _old_data:
             _old_data.return_value = False
-            assert pull_udp_handler._single_value(FIRTS_MEASUREMENT_NAME + '#raw')\
-                == '42.0,47.0'
-            _old_data.assert_called_once_with(FIRTS_MEASUREMENT_NAME)
+            command = FIRTS_MEASUREMENT_NAME + '#raw'
+            assert pull_udp_handler._single_value(command, SINGLE_ENTRY, NOW)\
+                == b'42.0,47.0'
+            _old_data.assert_called_once_with(FIRTS_MEASUREMENT_NAME, None, SINGLE_ENTRY, NOW)
 
     def test_single_json(self, pull_udp_handler, sockets_data_single):
         """Test the _single_value json case"""
         with mock.patch(SOCKETS_PATH.format('PullUDPHandler._old_data')) as _old_data:
             _old_data.return_value = False
-            assert pull_udp_handler._single_value(FIRTS_MEASUREMENT_NAME + '#json')\
-                == '[42.0, 47.0]'
-            _old_data.assert_called_once_with(FIRTS_MEASUREMENT_NAME)
+            command = FIRTS_MEASUREMENT_NAME + '#json'
+            out = pull_udp_handler._single_value(command, SINGLE_ENTRY, NOW)
+            assert json.loads(out.decode('ascii')) == [42.0, 47.0]
+            _old_data.assert_called_once_with(FIRTS_MEASUREMENT_NAME, None, SINGLE_ENTRY, NOW)
 
     def test_single_old(self, pull_udp_handler, sockets_data_single):
         """Test the _single_value old data case"""
         # raw case
         with mock.patch(SOCKETS_PATH.format('PullUDPHandler._old_data')) as _old_data:
             _old_data.return_value = True
-            assert pull_udp_handler._single_value(FIRTS_MEASUREMENT_NAME + '#raw')\
-                == 'OLD_DATA'
-            _old_data.assert_called_once_with(FIRTS_MEASUREMENT_NAME)
+            command = FIRTS_MEASUREMENT_NAME + '#raw'
+            assert pull_udp_handler._single_value(command, SINGLE_ENTRY, NOW)\
+                == b'OLD_DATA'
+            _old_data.assert_called_once_with(FIRTS_MEASUREMENT_NAME, None, SINGLE_ENTRY, NOW)
 
         # json case
         with mock.patch(SOCKETS_PATH.format('PullUDPHandler._old_data')) as _old_data:
             _old_data.return_value = True
-            assert pull_udp_handler._single_value(FIRTS_MEASUREMENT_NAME + '#json')\
-                == '"OLD_DATA"'
-            _old_data.assert_called_once_with(FIRTS_MEASUREMENT_NAME)
+            command = FIRTS_MEASUREMENT_NAME + '#json'
+            out = pull_udp_handler._single_value(command, SINGLE_ENTRY, NOW)
+            assert json.loads(out.decode('ascii')) == 'OLD_DATA'
+            _old_data.assert_called_once_with(FIRTS_MEASUREMENT_NAME, None, SINGLE_ENTRY, NOW)
 
     def test_single_unknown_command(self, pull_udp_handler, sockets_data_single):
         """Test the _single_value unknown command case"""
-        assert pull_udp_handler._single_value(FIRTS_MEASUREMENT_NAME + '#nonsense')\
-                == sockets.UNKNOWN_COMMAND
+        command = FIRTS_MEASUREMENT_NAME + '#nonsense'
+        assert pull_udp_handler._single_value(command, SINGLE_ENTRY, NOW)\
+                == sockets.UNKNOWN_COMMAND.encode('ascii')
 
     def test_all_raw(self, pull_udp_handler, sockets_data_all):
         """Test the _all_values raw case"""
-        with mock.patch(SOCKETS_PATH.format('PullUDPHandler._old_data')) as _old_data:
-            _old_data.return_value = False
-            assert pull_udp_handler._all_values('raw')\
-                == '42.0,47.0;17.0,1.0'
-            calls = [mock.call(FIRTS_MEASUREMENT_NAME), mock.call(SECOND_MEASUREMENT_NAME)]
-            _old_data.assert_has_calls(calls)
+        with mock.patch(SOCKETS_PATH.format('PullUDPHandler._stale_flags')) as _stale_flags:
+            _stale_flags.return_value = [False, False]
+            assert pull_udp_handler._all_values('raw', ALL_ENTRY, NOW)\
+                == b'42.0,47.0;17.0,1.0'
+            _stale_flags.assert_called_once_with(ALL_ENTRY, NOW)
 
     def test_all_json(self, pull_udp_handler, sockets_data_all):
         """Test the _all_values json case"""
-        with mock.patch(SOCKETS_PATH.format('PullUDPHandler._old_data')) as _old_data:
-            _old_data.return_value = False
-            assert pull_udp_handler._all_values('json')\
-                == '[[42.0, 47.0], [17.0, 1.0]]'
-            calls = [mock.call(FIRTS_MEASUREMENT_NAME), mock.call(SECOND_MEASUREMENT_NAME)]
-            _old_data.assert_has_calls(calls)
+        with mock.patch(SOCKETS_PATH.format('PullUDPHandler._stale_flags')) as _stale_flags:
+            _stale_flags.return_value = [False, False]
+            out = pull_udp_handler._all_values('json', ALL_ENTRY, NOW)
+            assert json.loads(out.decode('ascii')) == [[42.0, 47.0], [17.0, 1.0]]
+            _stale_flags.assert_called_once_with(ALL_ENTRY, NOW)
 
     def test_all_raw_with_names(self, pull_udp_handler, sockets_data_all):
         """Test the all values raw with names case"""
-        with mock.patch(SOCKETS_PATH.format('PullUDPHandler._old_data')) as _old_data:
-            _old_data.return_value = False
+        with mock.patch(SOCKETS_PATH.format('PullUDPHandler._stale_flags')) as _stale_flags:
+            _stale_flags.return_value = [False, False]
             expected = '{}:42.0,47.0;{}:17.0,1.0'.format(FIRTS_MEASUREMENT_NAME,
                                                          SECOND_MEASUREMENT_NAME)
-            assert pull_udp_handler._all_values('raw_wn') == expected
-            calls = [mock.call(FIRTS_MEASUREMENT_NAME), mock.call(SECOND_MEASUREMENT_NAME)]
-            _old_data.assert_has_calls(calls)
+            expected = expected.encode('ascii')
+            assert pull_udp_handler._all_values('raw_wn', ALL_ENTRY, NOW) == expected
+            _stale_flags.assert_called_once_with(ALL_ENTRY, NOW)
+
+    def test_all_raw_with_names_old(self, pull_udp_handler, sockets_data_all):
+        """Test the all values raw with names case with old data"""
+        with mock.patch(SOCKETS_PATH.format('PullUDPHandler._stale_flags')) as _stale_flags:
+            _stale_flags.return_value = [True, False]
+            expected = '{}:OLD_DATA;{}:17.0,1.0'.format(FIRTS_MEASUREMENT_NAME,
+                                                        SECOND_MEASUREMENT_NAME)
+            expected = expected.encode('ascii')
+            assert pull_udp_handler._all_values('raw_wn', ALL_ENTRY, NOW) == expected
+
+    def test_raw_with_non_pair_point(self, pull_udp_handler):
+        """Test that the raw responses use the first two items of points that are not pairs,
+        like the one LiveSocket.reset sets
+        """
+        entry = dict(ALL_ENTRY)
+        entry['data'] = {FIRTS_MEASUREMENT_NAME: tuple('RESET'),
+                         SECOND_MEASUREMENT_NAME: (17.0, 1.0)}
+        entry['_timeouts'] = [None, None]
+        entry['_has_timeouts'] = False
+        entry['_point_time'] = sockets._date_point_time
+        command = FIRTS_MEASUREMENT_NAME + '#raw'
+        assert pull_udp_handler._single_value(command, entry, NOW) == b'R,E'
+        assert pull_udp_handler._all_values('raw', entry, NOW) == b'R,E;17.0,1.0'
+        expected = '{}:R,E;{}:17.0,1.0'.format(FIRTS_MEASUREMENT_NAME, SECOND_MEASUREMENT_NAME)
+        assert pull_udp_handler._all_values('raw_wn', entry, NOW) == expected.encode('ascii')
 
     def test_all_json_with_names(self, pull_udp_handler, sockets_data_all):
         """Test the all values json with names case"""
-        with mock.patch(SOCKETS_PATH.format('PullUDPHandler._old_data')) as _old_data:
-            _old_data.return_value = False
+        with mock.patch(SOCKETS_PATH.format('PullUDPHandler._stale_flags')) as _stale_flags:
+            _stale_flags.return_value = [False, False]
             expected = {
                 FIRTS_MEASUREMENT_NAME: [42.0, 47.0],
                 SECOND_MEASUREMENT_NAME: [17.0, 1.0],
             }
-            assert json.loads(pull_udp_handler._all_values('json_wn')) == expected
-            calls = [mock.call(FIRTS_MEASUREMENT_NAME), mock.call(SECOND_MEASUREMENT_NAME)]
-            _old_data.assert_has_calls(calls)
+            out = pull_udp_handler._all_values('json_wn', ALL_ENTRY, NOW)
+            assert json.loads(out) == expected
+            _stale_flags.assert_called_once_with(ALL_ENTRY, NOW)
+
+    def test_all_json_with_names_old(self, pull_udp_handler, sockets_data_all):
+        """Test the all values json with names case with old data"""
+        with mock.patch(SOCKETS_PATH.format('PullUDPHandler._stale_flags')) as _stale_flags:
+            _stale_flags.return_value = [False, True]
+            expected = {
+                FIRTS_MEASUREMENT_NAME: [42.0, 47.0],
+                SECOND_MEASUREMENT_NAME: 'OLD_DATA',
+            }
+            out = pull_udp_handler._all_values('json_wn', ALL_ENTRY, NOW)
+            assert json.loads(out.decode('ascii')) == expected
+            # The data itself must not be changed
+            assert ALL_ENTRY['data'][SECOND_MEASUREMENT_NAME] == (17.0, 1.0)
 
     def test_all_codenames_raw(self, pull_udp_handler, sockets_data_all):
         """Test the _all_values codenames raw case"""
-        expected = FIRTS_MEASUREMENT_NAME + ',' + SECOND_MEASUREMENT_NAME
-        assert pull_udp_handler._all_values('codenames_raw') == expected
+        expected = (FIRTS_MEASUREMENT_NAME + ',' + SECOND_MEASUREMENT_NAME).encode('ascii')
+        assert pull_udp_handler._all_values('codenames_raw', ALL_ENTRY, NOW) == expected
 
     def test_all_codenames_json(self, pull_udp_handler, sockets_data_all):
         """Test the _all_values codenames json case"""
         expected = [FIRTS_MEASUREMENT_NAME, SECOND_MEASUREMENT_NAME]
-        assert json.loads(pull_udp_handler._all_values('codenames_json')) == expected
+        out = pull_udp_handler._all_values('codenames_json', ALL_ENTRY, NOW)
+        assert json.loads(out) == expected
 
     def test_all_name(self, pull_udp_handler, sockets_data_all):
         """Test the _all_values name case"""
-        assert pull_udp_handler._all_values('name') == NAME
+        assert pull_udp_handler._all_values('name', ALL_ENTRY, NOW) == NAME.encode('ascii')
 
     def test_all_status(self, pull_udp_handler, sockets_data_all):
         """Test the _all_values name case"""
@@ -334,51 +440,174 @@ class TestPullUDPHandler(object):
 
                 # Test the expected output
                 expected = {'system_status': 1, 'socket_server_status': 2}
-                assert json.loads(pull_udp_handler._all_values('status')) == expected
+                out = pull_udp_handler._all_values('status', ALL_ENTRY, NOW)
+                assert json.loads(out) == expected
 
     def test_all_invalid_command(self, pull_udp_handler):
         """Test the all invalid command case"""
-        assert pull_udp_handler._all_values('invalid_command') == sockets.UNKNOWN_COMMAND
+        assert pull_udp_handler._all_values('invalid_command', ALL_ENTRY, NOW)\
+            == sockets.UNKNOWN_COMMAND.encode('ascii')
+
+    def test_stale_flags_with_date_data(self, pull_udp_handler):
+        """Test the _stale_flags date data case"""
+        entry = {
+            'type': 'date', 'codenames': CODENAMES, '_timeouts': [None, 1.0],
+            '_has_timeouts': True, '_stale_flags': sockets._date_stale_flags,
+            'data': {FIRTS_MEASUREMENT_NAME: (NOW - 2.0, 1),
+                     SECOND_MEASUREMENT_NAME: (NOW, 2)},
+        }
+        assert pull_udp_handler._stale_flags(entry, NOW) == [False, False]
+        assert pull_udp_handler._stale_flags(entry, NOW + 2.0) == [False, True]
+
+    def test_stale_flags_with_xy_data(self, pull_udp_handler):
+        """Test the _stale_flags xy data case"""
+        entry = {
+            'type': 'data', 'codenames': CODENAMES, '_timeouts': [1.0, 1.0],
+            '_has_timeouts': True, '_stale_flags': sockets._data_stale_flags,
+            'data': {FIRTS_MEASUREMENT_NAME: (1, 'a'), SECOND_MEASUREMENT_NAME: (2, 'b')},
+            'timestamps': {FIRTS_MEASUREMENT_NAME: NOW - 2.0, SECOND_MEASUREMENT_NAME: NOW},
+        }
+        assert pull_udp_handler._stale_flags(entry, NOW) == [True, False]
+
+    def test_stale_flags_unkonwn_type(self, pull_udp_handler):
+        """Test the _stale_flags unknown type case"""
+        entry = {'type': 'nonsense type', 'codenames': CODENAMES, '_timeouts': [1.0, None],
+                 '_has_timeouts': True}
+        with pytest.raises(NotImplementedError):
+            pull_udp_handler._stale_flags(entry, NOW)
+
+    def test_stale_flags_without_timeouts(self, pull_udp_handler):
+        """Test that _stale_flags does not look at the data when there are no timeouts"""
+        entry = {'type': 'date', 'codenames': CODENAMES, '_timeouts': [None, None],
+                 '_has_timeouts': False}
+        assert pull_udp_handler._stale_flags(entry, NOW) == [False, False]
 
     def test_old_data_with_date_data(self, pull_udp_handler, sockets_data_single):
         """Test the _old_date date data true case"""
-        sockets_data_single[PORT]['type'] = 'date'
+        entry = sockets_data_single[PORT]
+        entry['type'] = 'date'
+        entry['_point_time'] = sockets._date_point_time
 
         # Test without a timeout
-        sockets_data_single[PORT]['timeouts'] = {}
-        assert pull_udp_handler._old_data(FIRTS_MEASUREMENT_NAME) is False
+        assert pull_udp_handler._old_data(FIRTS_MEASUREMENT_NAME, None, entry, time.time())\
+            is False
 
         # Test with timeout and old data
-        sockets_data_single[PORT]['timeouts'] = {FIRTS_MEASUREMENT_NAME: 1.0}
         sockets_data_single[PORT]['data'][FIRTS_MEASUREMENT_NAME] = (time.time() - 2.0, 47)
-        assert pull_udp_handler._old_data(FIRTS_MEASUREMENT_NAME) is True
+        assert pull_udp_handler._old_data(FIRTS_MEASUREMENT_NAME, 1.0, entry, time.time())\
+            is True
 
         # Test with timeout and new data
         sockets_data_single[PORT]['data'][FIRTS_MEASUREMENT_NAME] = (time.time(), 47)
-        assert pull_udp_handler._old_data(FIRTS_MEASUREMENT_NAME) is False
+        assert pull_udp_handler._old_data(FIRTS_MEASUREMENT_NAME, 1.0, entry, time.time())\
+            is False
 
     def test_old_data_with_xy_data(self, pull_udp_handler, sockets_data_single):
         """Test the _old_data xy data case"""
-        sockets_data_single[PORT]['type'] = 'data'
+        entry = sockets_data_single[PORT]
+        entry['type'] = 'data'
+        entry['_point_time'] = sockets._data_point_time
 
         # Test without a timeout
-        sockets_data_single[PORT]['timeouts'] = {}
-        assert pull_udp_handler._old_data(FIRTS_MEASUREMENT_NAME) is False
+        assert pull_udp_handler._old_data(FIRTS_MEASUREMENT_NAME, None, entry, time.time())\
+            is False
 
         # Test with timeout and old data
-        sockets_data_single[PORT]['timeouts'] = {FIRTS_MEASUREMENT_NAME: 1.0}
         sockets_data_single[PORT]['timestamps'] = {FIRTS_MEASUREMENT_NAME: time.time() - 2.0}
-        assert pull_udp_handler._old_data(FIRTS_MEASUREMENT_NAME) is True
+        assert pull_udp_handler._old_data(FIRTS_MEASUREMENT_NAME, 1.0, entry, time.time())\
+            is True
 
         # Test with timeout and new data
         sockets_data_single[PORT]['timestamps'] = {FIRTS_MEASUREMENT_NAME: time.time()}
-        assert pull_udp_handler._old_data(FIRTS_MEASUREMENT_NAME) is False
+        assert pull_udp_handler._old_data(FIRTS_MEASUREMENT_NAME, 1.0, entry, time.time())\
+            is False
 
     def test_old_data_unkonwn_type(self, pull_udp_handler, sockets_data_single):
         """Test the old data unknown type case"""
-        sockets_data_single[PORT]['type'] = 'nonsense type'
+        entry = sockets_data_single[PORT]
+        entry['type'] = 'nonsense type'
+        entry.pop('_point_time', None)
         with pytest.raises(NotImplementedError):
-            pull_udp_handler._old_data(FIRTS_MEASUREMENT_NAME)
+            pull_udp_handler._old_data(FIRTS_MEASUREMENT_NAME, 1.0, entry, NOW)
+
+
+class TestPullUDPServer(object):
+    """Test the PullUDPServer"""
+
+    @pytest.fixture
+    def pull_server(self):
+        """A PullUDPServer with a mocked socket"""
+        pull_server = sockets.PullUDPServer(('', PORT), PullUDPHandler,
+                                            bind_and_activate=False)
+        pull_server.server_close()
+        pull_server.socket = mock.MagicMock()
+        yield pull_server
+
+    @pytest.mark.parametrize("busy_poll", [0, 50], ids=['busy_poll_off', 'busy_poll_on'])
+    def test_server_bind(self, pull_server, busy_poll):
+        """Test that busy polling is only enabled when requested"""
+        pull_server.busy_poll = busy_poll
+        with mock.patch('sys.platform', 'linux'):
+            pull_server.server_bind()
+        busy_poll_call = mock.call(socket.SOL_SOCKET, sockets.SO_BUSY_POLL, 50)
+        if busy_poll:
+            assert busy_poll_call in pull_server.socket.setsockopt.call_args_list
+        else:
+            assert busy_poll_call not in pull_server.socket.setsockopt.call_args_list
+        pull_server.socket.bind.assert_called_once_with(('', PORT))
+
+    def test_busy_poll_argument(self):
+        """Test that the busy_poll argument only overrides the class default per server"""
+        pull_server = sockets.PullUDPServer(('', PORT), PullUDPHandler,
+                                            bind_and_activate=False, busy_poll=50)
+        pull_server.server_close()
+        assert pull_server.busy_poll == 50
+        assert sockets.PullUDPServer.busy_poll == 0
+        default_server = sockets.PullUDPServer(('', PORT), PullUDPHandler,
+                                               bind_and_activate=False)
+        default_server.server_close()
+        assert default_server.busy_poll == 0
+
+    def test_server_activate(self, pull_server):
+        """Test that the socket is made non-blocking"""
+        pull_server.server_activate()
+        pull_server.socket.setblocking.assert_called_once_with(False)
+
+    def test_drain_queued(self, pull_server):
+        """Test that all queued datagrams are handled on one wake up"""
+        datagrams = [(b'raw', CLIENT_ADDRESS), (b'json', CLIENT_ADDRESS),
+                     (b'name', CLIENT_ADDRESS)]
+        pull_server.socket.recvfrom.side_effect = datagrams + [socket.error('EAGAIN')]
+        with mock.patch.object(pull_server, 'process_request') as process_request:
+            pull_server._handle_request_noblock()
+        calls = [mock.call((request, pull_server.socket), address)
+                 for request, address in datagrams]
+        assert process_request.call_args_list == calls
+
+    def test_drain_max_batch(self, pull_server):
+        """Test that at most max_batch datagrams are handled on one wake up"""
+        pull_server.socket.recvfrom.return_value = (b'raw', CLIENT_ADDRESS)
+        with mock.patch.object(pull_server, 'process_request') as process_request:
+            pull_server._handle_request_noblock()
+        assert process_request.call_count == pull_server.max_batch
+
+    def test_handler_reused(self, pull_server):
+        """Test that the request handler is only instantiated for the first request"""
+        pull_server.RequestHandlerClass = mock.MagicMock()
+        handler = pull_server.RequestHandlerClass.return_value
+        pull_server.finish_request((b'raw', pull_server.socket), CLIENT_ADDRESS)
+        pull_server.RequestHandlerClass.assert_called_once_with(
+            (b'raw', pull_server.socket), CLIENT_ADDRESS, pull_server
+        )
+        assert not handler.handle.called
+
+        pull_server.finish_request((b'json', pull_server.socket), ('127.0.0.2', 1234))
+        assert pull_server.RequestHandlerClass.call_count == 1
+        assert handler.request == (b'json', pull_server.socket)
+        assert handler.client_address == ('127.0.0.2', 1234)
+        handler.setup.assert_called_once_with()
+        handler.handle.assert_called_once_with()
+        handler.finish.assert_called_once_with()
 
 
 class TestCommonDataPullSocket(object):
@@ -391,7 +620,7 @@ class TestCommonDataPullSocket(object):
                              ids=['check_activity_T', 'check_activity_F'])
     @pytest.mark.parametrize("timeouts", [1.0, [3.0, 5.0]],
                              ids=['single_timeout', 'timeout_list'])
-    def test_init(self, cdps_init_args, udp_server, clean_data, init_timeouts, timeouts,
+    def test_init(self, cdps_init_args, pull_udp_server, clean_data, init_timeouts, timeouts,
                   check_activity):
         """Test assigning name
 
@@ -404,7 +633,7 @@ class TestCommonDataPullSocket(object):
         })
 
         # Setup server dummy and init socket
-        udp_server.return_value = 'SERVER_DUMMY'
+        pull_udp_server.return_value = 'SERVER_DUMMY'
         sock = CommonDataPullSocket(**cdps_init_args)
 
         # Check that thread is daemon and that the port is set
@@ -415,7 +644,9 @@ class TestCommonDataPullSocket(object):
         config = clean_data[PORT]
 
         # Check that the configuration dict has the correct keys
-        expected_keys = {'codenames', 'data', 'name', 'activity'}
+        expected_keys = {'codenames', 'data', 'name', 'activity', '_raw_wn_templates',
+                         '_codenames_raw_bytes', '_codenames_json_bytes', '_timeouts',
+                         '_has_timeouts', '_codename_index'}
         if cdps_init_args['init_timeouts']:
             expected_keys.add('timeouts')
         assert set(config.keys()) == expected_keys
@@ -427,24 +658,37 @@ class TestCommonDataPullSocket(object):
         assert config['activity']['activity_timeout'] == cdps_init_args['activity_timeout']
         assert abs(time.time() - config['activity']['last_activity']) < 1E-2
 
+        # Check the pre-computed raw_wn templates
+        assert config['_raw_wn_templates'] ==\
+            [(name + ':%s,%s', name + ':OLD_DATA') for name in CODENAMES]
+
+        # Check the codename index
+        assert config['_codename_index'] == {name: i for i, name in enumerate(CODENAMES)}
+
+        # Check the cached codenames responses
+        assert config['_codenames_raw_bytes'] == ','.join(CODENAMES).encode('ascii')
+        assert json.loads(config['_codenames_json_bytes'].decode('ascii')) == CODENAMES
+
         # Check data initialization with defaults
         assert config['data'] ==\
             {name: (cdps_init_args['default_x'], cdps_init_args['default_y'])
              for name in CODENAMES}
 
         # Check init of timeouts
+        # If timeouts is given as a single number, make a list
+        if not isinstance(timeouts, collections.abc.Iterable):
+            timeouts = [timeouts] * len(CODENAMES)
+        assert config['_timeouts'] == list(timeouts)
+        assert config['_has_timeouts'] is any(timeout is not None for timeout in timeouts)
         if init_timeouts:
-            # If timeouts is given as a single number, make a list
-            if not isinstance(timeouts, collections.abc.Iterable):
-                timeouts = [timeouts] * len(CODENAMES)
-            timeouts = dict(zip(CODENAMES, timeouts))
-            assert config['timeouts'] == timeouts
-
-        # Check that SocketServer.UDPServer is called
-        udp_server.assert_called_once_with(('', PORT), cdps_init_args['handler_class'])
+            assert config['timeouts'] == dict(zip(CODENAMES, timeouts))
+
+        # Check that PullUDPServer is called
+        pull_udp_server.assert_called_once_with(('', PORT), cdps_init_args['handler_class'],
+                                                busy_poll=None)
         assert sock.server == 'SERVER_DUMMY'
 
-    def test_port_already_used_error(self, cdps_init_args, udp_server, clean_data):
+    def test_port_already_used_error(self, cdps_init_args, pull_udp_server, clean_data):
         """Test that reusing a port"""
         clean_data[PORT] = 'Anything here'
         with pytest.raises(ValueError) as exception:
@@ -452,7 +696,7 @@ class TestCommonDataPullSocket(object):
         assert str(exception.value) == 'A UDP server already exists on port: {}'.format(PORT)
 
 
-    def test_bad_timeout_length_error(self, cdps_init_args, udp_server, clean_data):
+    def test_bad_timeout_length_error(self, cdps_init_args, pull_udp_server, clean_data):
         """Test that giving a bad number of timeouts will raise an exception"""
         cdps_init_args['timeouts'] = [9.0] * 5
         with pytest.raises(ValueError) as exception:
@@ -461,7 +705,7 @@ class TestCommonDataPullSocket(object):
                              'as there are in codenames'
         assert str(exception.value) == expected_error_msg
 
-    def test_repeat_codename_error(self, cdps_init_args, udp_server, clean_data):
+    def test_repeat_codename_error(self, cdps_init_args, pull_udp_server, clean_data):
         """Test that a repeated codename gives an error"""
         cdps_init_args['codenames'] = [FIRTS_MEASUREMENT_NAME] * 2
         with pytest.raises(ValueError) as exception:
@@ -470,7 +714,7 @@ class TestCommonDataPullSocket(object):
                              'is present more than once'.format(FIRTS_MEASUREMENT_NAME)
         assert str(exception.value) == expected_error_msg
 
-    def test_bad_char_in_codename_error(self, cdps_init_args, udp_server, clean_data):
+    def test_bad_char_in_codename_error(self, cdps_init_args, pull_udp_server, clean_data):
         """Test that a bad char in a codename gives an error"""
         cdps_init_args['codenames'][0] = FIRTS_MEASUREMENT_NAME + '#'
         with pytest.raises(ValueError) as exception:
@@ -478,7 +722,14 @@ class TestCommonDataPullSocket(object):
         expected_error_msg = 'The character \'#\' is not allowed in the codenames'
         assert str(exception.value) == expected_error_msg
 
-    def test_udp_server_exception(self, cdps_init_args, udp_server, clean_data):
+    def test_percent_in_codename(self, cdps_init_args, pull_udp_server, clean_data):
+        """Test that a percent sign in a codename survives the raw_wn template"""
+        cdps_init_args['codenames'][0] = 'percent%s'
+        CommonDataPullSocket(**cdps_init_args)
+        template = clean_data[PORT]['_raw_wn_templates'][0][0]
+        assert template % (1.0, 2.0) == 'percent%s:1.0,2.0'
+
+    def test_udp_server_exception(self, cdps_init_args, pull_udp_server, clean_data):
         """Test that if UDPServer raises we either intercept of code is 98 or re raise"""
         class MyException(Exception):
             """Exception with errno"""
@@ -491,12 +742,12 @@ class TestCommonDataPullSocket(object):
         socket.error = MyException
 
         # If errno is 97, we re-raise the exception
-        udp_server.side_effect = MyException('BOOM', 97)
+        pull_udp_server.side_effect = MyException('BOOM', 97)
         with pytest.raises(MyException):
             CommonDataPullSocket(**cdps_init_args)
 
         del clean_data[PORT]
-        udp_server.side_effect = MyException('BOOM', 98)
+        pull_udp_server.side_effect = MyException('BOOM', 98)
         with pytest.raises(sockets.PortStillReserved):
             CommonDataPullSocket(**cdps_init_args)
 
@@ -538,7 +789,7 @@ class TestCommonDataPullSocket(object):
 class TestDataPullSocket(object):
     """Test the DataPullSocket"""
 
-    def test_init_super_calls(self, clean_data, udp_server):
+    def test_init_super_calls(self, clean_data, pull_udp_server):
         """Test the __init__ method"""
         # Monkey patch CommonDataPullSocket.__init__ with memory version
         original_init = CommonDataPullSocket.__init__
@@ -555,17 +806,17 @@ class TestDataPullSocket(object):
         assert trace_init.call_spec[1] == {
             'port':9010, 'default_x': 0.0,
             'default_y' :0.0, 'timeouts': None,
-            'check_activity': True, 'activity_timeout': 900
+            'check_activity': True, 'activity_timeout': 900, 'busy_poll': None
         }
 
         # With other key word arguments
         trace_init.call_spec = None
         DataPullSocket(NAME, CODENAMES, port=1234, default_x=56.0, default_y=7.7, timeouts=9.0,
-                       check_activity=False, activity_timeout=180)
+                       check_activity=False, activity_timeout=180, busy_poll=50)
         assert trace_init.call_spec[1] == {
             'port':1234, 'default_x': 56.0,
             'default_y' :7.7, 'timeouts': 9.0,
-            'check_activity': False, 'activity_timeout': 180
+            'check_activity': False, 'activity_timeout': 180, 'busy_poll': 50
         }
 
         # Revert monkey patch
@@ -573,10 +824,12 @@ class TestDataPullSocket(object):
 
     @pytest.mark.parametrize("poke_on_set", [True, False],
                              ids=['poke_on_set_T', 'poke_on_set_F'])
-    def test_init_properties(self, clean_data, udp_server, poke_on_set):
+    def test_init_properties(self, clean_data, pull_udp_server, poke_on_set):
         """Test setting of properties"""
         sock = DataPullSocket(NAME, CODENAMES, poke_on_set=poke_on_set)
         assert clean_data[9010]['type'] == 'data'
+        assert clean_data[9010]['_point_time'] is sockets._data_point_time
+        assert clean_data[9010]['_stale_flags'] is sockets._data_stale_flags
         assert clean_data[9010]['timestamps'] == {name: 0.0 for name in CODENAMES}
         assert sock.poke_on_set == poke_on_set
 
@@ -587,7 +840,8 @@ class TestDataPullSocket(object):
                              ids=['check_activity_T', 'check_activity_F'])
     @pytest.mark.parametrize("timestamp", [None, 12345.6],
                              ids=['timestamp_none', 'timestamp_set'])
-    def test_set_point(self, clean_data, udp_server, poke_on_set, timestamp, check_activity):
+    def test_set_point(self, clean_data, pull_udp_server, poke_on_set, timestamp,
+                       check_activity):
         """Test the set_point method"""
         point = [5.6, 7.8]
         with mock.patch('PyExpLabSys.common.sockets.DataPullSocket.poke') as poke:
@@ -615,7 +869,7 @@ class TestDataPullSocket(object):
 class TestDateDataPullSocket(object):
     """Test the DateDataPullSocket class"""
 
-    def test_init_super_calls(self, clean_data, udp_server):
+    def test_init_super_calls(self, clean_data, pull_udp_server):
         """Test the __init__ method"""
         # Monkey patch CommonDataPullSocket.__init__ with memory version
         original_init = CommonDataPullSocket.__init__
@@ -632,17 +886,18 @@ class TestDateDataPullSocket(object):
         assert trace_init.call_spec[1] == {
             'port':9000, 'default_x': 0.0,
             'default_y' :0.0, 'timeouts': None,
-            'check_activity': True, 'activity_timeout': 900
+            'check_activity': True, 'activity_timeout': 900, 'busy_poll': None
         }
 
         # With other key word arguments
         trace_init.call_spec = None
         DateDataPullSocket(NAME, CODENAMES, port=1234, default_x=56.0, default_y=7.7,
-                           timeouts=9.0, check_activity=False, activity_timeout=180)
+                           timeouts=9.0, check_activity=False, activity_timeout=180,
+                           busy_poll=50)
         assert trace_init.call_spec[1] == {
             'port':1234, 'default_x': 56.0,
             'default_y' :7.7, 'timeouts': 9.0,
-            'check_activity': False, 'activity_timeout': 180
+            'check_activity': False, 'activity_timeout': 180, 'busy_poll': 50
         }
 
         # Revert monkey patch
@@ -650,13 +905,15 @@ class TestDateDataPullSocket(object):
 
     @pytest.mark.parametrize("poke_on_set", [True, False],
                              ids=['poke_on_set_T', 'poke_on_set_F'])
-    def test_init_properties(self, clean_data, udp_server, poke_on_set):
+    def test_init_properties(self, clean_data, pull_udp_server, poke_on_set):
         """Test setting of properties"""
         sock = DateDataPullSocket(NAME, CODENAMES, poke_on_set=poke_on_set)
         assert clean_data[9000]['type'] == 'date'
+        assert clean_data[9000]['_point_time'] is sockets._date_point_time
+        assert clean_data[9000]['_stale_flags'] is sockets._date_stale_flags
         assert sock.poke_on_set == poke_on_set
 
-    def test_set_point_now(self, clean_data, udp_server):
+    def test_set_point_now(self, clean_data, pull_udp_server):
         """Test setting of properties"""
         with mock.patch(SOCKETS_PATH.format('DateDataPullSocket.set_point')) as set_point:
             with mock.patch('time.time') as time:
@@ -671,7 +928,7 @@ class TestDateDataPullSocket(object):
                              ids=['poke_on_set_T', 'poke_on_set_F'])
     @pytest.mark.parametrize("check_activity", [True, False],
                              ids=['check_activity_T', 'check_activity_F'])
-    def test_set_point(self, clean_data, udp_server, poke_on_set, check_activity):
+    def test_set_point(self, clean_data, pull_udp_server, poke_on_set, check_activity):
         """Test the set_point method"""
         point = [5.6, 7.8]
         with mock.patch('PyExpLabSys.common.sockets.DateDataPullSocket.poke') as poke:
@@ -1158,6 +1415,17 @@ class TestPushUDPHandler(object):
 class TestDataPushSocket(object):
     """Test the DataPushSocket"""
 
+    @pytest.fixture
+    def udp_server(self):
+        """A UDPServer fixure (the DataPushSocket uses a plain UDPServer)"""
+        if sys.version_info[0] == 2:
+            with mock.patch('SocketServer.UDPServer') as udp_server:
+                yield udp_server
+        # SocketServer was renamed to socketserver in Python 3
+        else:
+            with mock.patch('socketserver.UDPServer') as udp_server:
+                yield udp_server
+
     @pytest.mark.parametrize('port', [8500, 8765])
     def test_init_common(self, clean_data, udp_server, port):
         """Test the common initializations in init"""